@@ -0,0 +1,170 @@
+"""benchmarks the stages of heath.py on synthetic buildings, without Rhino
+usage: `python bench_heath.py --floors 1 5 10 --rooms 10 20 -o bench.csv`
+compare with an earlier run: `python bench_heath.py ... --compare old_bench.csv`"""
+
+import argparse
+from contextlib import redirect_stdout
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from ladybug_geometry.geometry3d.face import Face3D
+from ladybug_geometry.geometry3d.mesh import Mesh3D
+from ladybug_geometry.geometry3d.plane import Plane
+from ladybug_geometry.geometry3d.pointvector import Point3D
+from ladybug_geometry.geometry3d.polyface import Polyface3D
+
+import heath
+
+STAGES = [
+    "_create_rooms",
+    "_solve_adjacency",
+    "_update_boundary_conditions",
+    "_add_subfaces",
+    "_auto_hb_apertures",
+    "_add_window_shades",
+    "_add_shades",
+    "_generate_hb_model",
+]
+FIELDS = ["version", "timestamp", "floors", "rooms_per_floor", "rooms", "windows",
+    "context_faces", "stage", "seconds"]
+
+
+def make_rooms(floors, rooms_per_floor, width=4.0, depth=6.0, height=3.0):
+    """Box rooms in a row along x, stacked in floors"""
+    return [Polyface3D.from_box(width, depth, height, Plane(o=Point3D(i * width, 0, f * height)))
+        for f in range(floors) for i in range(rooms_per_floor)]
+
+
+def make_windows(floors, rooms_per_floor, density, width=4.0, height=3.0):
+    """Window rectangles on the facade at y = 0, density windows per room"""
+    windows = []
+    w = width / (2 * density)
+    for f in range(floors):
+        for i in range(rooms_per_floor):
+            for k in range(density):
+                x = i * width + (2 * k + 0.5) * w
+                z = f * height + 0.9
+                windows.append(Face3D((Point3D(x, 0, z), Point3D(x + w, 0, z),
+                    Point3D(x + w, 0, z + 1.5), Point3D(x, 0, z + 1.5))))
+    return windows
+
+
+def make_guides(floors, rooms_per_floor, depth=6.0, width=4.0, height=3.0):
+    """Party walls at both ends of the building"""
+    x_max, z_max = rooms_per_floor * width, floors * height
+    return [Face3D((Point3D(x, 0, 0), Point3D(x, depth, 0), Point3D(x, depth, z_max), Point3D(x, 0, z_max)))
+        for x in (0, x_max)]
+
+
+def make_context(faces, size_x, distance=20.0):
+    """A wavy quad mesh with about the given number of faces, facing the facade"""
+    if faces <= 0:
+        return []
+    n = max(1, int(faces ** 0.5))
+    step = max(size_x, 10.0) / n
+    verts = [Point3D(i * step, -distance - (j % 2) * 0.5, j * step) for j in range(n + 1) for i in range(n + 1)]
+    quads = [(j * (n + 1) + i, j * (n + 1) + i + 1, (j + 1) * (n + 1) + i + 1, (j + 1) * (n + 1) + i)
+        for j in range(n) for i in range(n)]
+    return [Mesh3D(verts, quads)]
+
+
+def run_case(floors, rooms_per_floor, density, context_faces, louvers):
+    """Times each stage once for one building size
+
+    Returns:
+        dict: Seconds per stage and object counts
+    """
+    times = {}
+    def timed(stage, fn, *args, **kwargs):
+        s = time.perf_counter()
+        result = fn(*args, **kwargs)
+        times[stage] = time.perf_counter() - s
+        return result
+
+    polyfaces = make_rooms(floors, rooms_per_floor)
+    window_faces = make_windows(floors, rooms_per_floor, density)
+    rooms = timed("_create_rooms", heath._create_rooms, polyfaces, [])
+    rooms = timed("_solve_adjacency", heath._solve_adjacency, rooms, mutate=True)
+    rooms = timed("_update_boundary_conditions", heath._update_boundary_conditions,
+        rooms, make_guides(floors, rooms_per_floor), mutate=True)
+
+    auto_rooms = [room.duplicate() for room in rooms]
+    timed("_auto_hb_apertures", heath._auto_hb_apertures, auto_rooms, 0.4, 2.0, 0.8, 3.0)
+
+    apertures = heath._create_hb_apertures(window_faces)
+    rooms = timed("_add_subfaces", heath._add_subfaces, rooms, apertures, mutate=True)
+    ws = heath.WindowSettings(0.4, 2.0, 0.8, 3.0, 0.2)
+    ls = heath.LouverSettings(0.3, louvers, 0.0, 0.0, False) if louvers else None
+    rooms = timed("_add_window_shades", heath._add_window_shades, rooms, ws, ls, mutate=True)
+
+    context = make_context(context_faces, rooms_per_floor * 4.0)
+    shades, _ = timed("_add_shades", heath._add_shades, context)
+    timed("_generate_hb_model", heath._generate_hb_model, "bench", rooms, None, shades)
+    return times, {"rooms": len(polyfaces), "windows": len(window_faces)}
+
+
+def main(args):
+    heath.load_dependencies() # the stages are called directly
+    print("\n".join(heath.import_report()))
+    rows = []
+    stamp = datetime.now().isoformat(timespec="seconds")
+    for floors in args.floors:
+        for rooms_per_floor in args.rooms:
+            for context_faces in args.context_faces:
+                best = {}
+                for _ in range(args.repeat):
+                    with open(os.devnull, "w") as devnull, redirect_stdout(devnull): # stages print adjacency info
+                        times, counts = run_case(floors, rooms_per_floor, args.window_density, context_faces, args.louvers)
+                    for stage, seconds in times.items():
+                        best[stage] = min(seconds, best.get(stage, seconds))
+                for stage in STAGES:
+                    rows.append({"version": heath.heath_globals.version, "timestamp": stamp, "floors": floors,
+                        "rooms_per_floor": rooms_per_floor, "rooms": counts["rooms"], "windows": counts["windows"],
+                        "context_faces": context_faces, "stage": stage, "seconds": best[stage]})
+                print(f"{floors} floors x {rooms_per_floor} rooms, {context_faces} context faces: "
+                    + ", ".join(f"{stage} {best[stage]:.3f} s" for stage in STAGES))
+
+    new_file = not os.path.isfile(args.output)
+    with open(args.output, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+    print(f"wrote {len(rows)} rows to {args.output}")
+
+    if args.compare:
+        compare(rows, args.compare, args.threshold)
+
+
+def compare(rows, path, threshold):
+    """Prints stages which got slower than in the latest run of an earlier results file"""
+    with open(path, newline="") as f:
+        old_rows = list(csv.DictReader(f))
+    if not old_rows:
+        return
+    latest = max(r["timestamp"] for r in old_rows)
+    key = lambda r: (int(r["floors"]), int(r["rooms_per_floor"]), int(r["context_faces"]), r["stage"])
+    old = {key(r): float(r["seconds"]) for r in old_rows if r["timestamp"] == latest}
+    for r in rows:
+        before = old.get(key(r))
+        if before and r["seconds"] > before * threshold:
+            print(f"REGRESSION {key(r)}: {before:.3f} s -> {r['seconds']:.3f} s")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--floors", type=int, nargs="+", default=[1, 5, 10], help="floor counts to sweep")
+    arg_parser.add_argument("--rooms", type=int, nargs="+", default=[10, 20], help="rooms per floor to sweep")
+    arg_parser.add_argument("--window-density", type=int, default=2, help="windows per room")
+    arg_parser.add_argument("--context-faces", type=int, nargs="+", default=[1000], help="context mesh face counts to sweep")
+    arg_parser.add_argument("--louvers", type=int, default=3, help="louvers per window, 0 for border shades only")
+    arg_parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is kept")
+    arg_parser.add_argument("-o", "--output", default="bench_heath.csv", help="csv file results are appended to")
+    arg_parser.add_argument("--compare", help="earlier results file to compare against")
+    arg_parser.add_argument("--threshold", type=float, default=1.2, help="slowdown factor reported as regression")
+    main(args = arg_parser.parse_args())
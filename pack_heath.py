@@ -30,6 +30,11 @@ def main(args):
             f"./src/heath_ui.py": f"{target_dir}/UserObjects/heath/heath_ui.py",
             f"./icons/butterfly_heath.png": f"{target_dir}/UserObjects/heath/butterfly_heath.png",
             f"./src/patch_honeybee.py": f"{target_dir}/UserObjects/heath/patch_honeybee.py",
+            f"./src/heath_cache.py": f"{target_dir}/UserObjects/heath/heath_cache.py",
+            f"./src/heath_geometry.py": f"{target_dir}/UserObjects/heath/heath_geometry.py",
+            f"./src/heath_trace.py": f"{target_dir}/UserObjects/heath/heath_trace.py",
+            f"./src/heath_batch.py": f"{target_dir}/UserObjects/heath/heath_batch.py",
+            f"./src/heath_deps.py": f"{target_dir}/UserObjects/heath/heath_deps.py",
         }
 
         for f,t in files.items():
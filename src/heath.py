@@ -20,51 +20,115 @@ Inspired by Ladybug Tools 1.6.0:
 - HB HeatCool HVAC
 """
 
+from __future__ import annotations # annotations name dependencies which are only imported by load_dependencies
+from time import perf_counter
+_import_start = perf_counter()
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import threading
 from dataclasses import dataclass
+import gzip
 import json
-from time import time as t
-from typing import Any, Dict, List, Optional, Union
-from Grasshopper.Kernel import GH_RuntimeMessageLevel as Message # type: ignore
-import rhinoscriptsyntax as rs
-import os, sys
-import Rhino # type: ignore
-from Rhino.Geometry import Brep, Surface, Mesh # type: ignore
-import scriptcontext as sc
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+import math, os
 import importlib
+import inspect
 from pathlib import Path
 
-from patch_honeybee import to_polyface3d_patched, to_face3d_patched
-
-try:  # import the ladybug_rhino and honeybee dependencies
-    from ladybug_rhino.config import units_system, angle_tolerance, tolerance
-    # MEGA HACK because something changed in the Rhino API rendering HB useless
-    # https://discourse.ladybug.tools/t/ladybug-modules-relying-on-rhino-geometry-collections-seem-not-to-work-in-rhino-8-python-3/25222
-    # from ladybug_rhino.togeometry import to_polyface3d
-
-    from honeybee_energy.constructionset import ConstructionSet
-    from honeybee_energy.programtype import ProgramType
-    from honeybee.boundarycondition import boundary_conditions, Outdoors
-    from honeybee_energy.hvac.heatcool import EQUIPMENT_TYPES_DICT
-    from honeybee_energy.config import folders as hb_energy_config_folders
-    from honeybee.face import Face
-    from honeybee.facetype import Wall
-    from honeybee.aperture import Aperture
-    from honeybee.model import Model
-    from honeybee.shade import Shade
+try:  # Rhino and Grasshopper, unavailable when heath runs headless on ladybug_geometry input
+    from Grasshopper.Kernel import GH_RuntimeMessageLevel as Message # type: ignore
+    import Rhino # type: ignore
+    from Rhino.Geometry import Brep, Surface, Mesh # type: ignore
     from Rhino.Geometry import MeshingParameters as mp # type: ignore
+    import scriptcontext as sc
     meshing_parameters = mp.FastRenderMesh
-    
-    importlib.reload(sys.modules["patch_honeybee"])
-    from ladybug_rhino.grasshopper import document_counter
-    from honeybee.room import Room
-    from honeybee_energy.properties.room import RoomEnergyProperties
-    from honeybee.typing import clean_string, clean_and_id_string, clean_and_id_ep_string
-    
-    from ladybug_rhino.intersect import bounding_box, intersect_solids
-    from ladybug_geometry.geometry2d.pointvector import Vector2D
-    from ladybug_geometry.geometry3d.face import Face3D
-except ImportError as e:
-    raise ImportError('\nFailed to import ladybug_rhino:\n\t{}'.format(e))
+    sticky = sc.sticky
+except ImportError:
+    Message = Rhino = mp = sc = meshing_parameters = None
+    Brep = Surface = Mesh = type("RhinoUnavailable", (), {})
+    sticky = {}
+
+if TYPE_CHECKING: # bound by load_dependencies, imported here for linters and type checkers only
+    import heath_deps
+
+from heath_cache import DiskCache, LRUCache, content_hash
+import heath_trace
+from heath_trace import BuildCancelled, Trace
+
+_dependencies_loaded = False
+_dependencies_lock = threading.RLock()
+_import_times: List[tuple[str, float]] = []
+
+def load_dependencies() -> None:
+    """Imports heath_deps, which holds the ladybug_rhino, honeybee and heath geometry dependencies, once
+
+    Importing heath only loads the settings and the build job machinery, so Grasshopper
+    files open without waiting for the honeybee stack. The dependencies are imported by
+    the first build, or by calling this e.g. from a background thread to warm up. Stages
+    use them as heath_deps.name; called directly (as in bench_heath.py) they need this to
+    be called first. patch_honeybee and heath_deps are reloaded when the patch_honeybee
+    file changed since it was last loaded.
+    """
+    global _dependencies_loaded, heath_deps
+    with _dependencies_lock:
+        if _dependencies_loaded:
+            return
+        import heath_deps
+        import patch_honeybee
+        stamp = os.stat(patch_honeybee.__file__).st_mtime_ns
+        if sticky.get("heath_patch_honeybee_mtime", stamp) != stamp: # edited since it was loaded
+            importlib.reload(patch_honeybee)
+            heath_deps = importlib.reload(heath_deps)
+        sticky["heath_patch_honeybee_mtime"] = stamp
+        _dependencies_loaded = True
+
+def __getattr__(name: str) -> Any:
+    """Loads the dependencies when one of them is used as heath.name, e.g. heath.Room"""
+    if not name.startswith("__"):
+        load_dependencies()
+        if name in globals():
+            return globals()[name]
+        if hasattr(heath_deps, name) and not name.startswith("_"):
+            return getattr(heath_deps, name)
+    raise AttributeError(f"module 'heath' has no attribute '{name}'")
+
+def import_report() -> List[str]:
+    """Report lines of the time spent importing heath and its dependencies
+
+    Returns:
+        List[str]: Lines like "Imported honeybee in 0.8 s", dependencies only once loaded
+    """
+    times = _import_times + (heath_deps.import_times if _dependencies_loaded else [])
+    return [f"Imported {name} in {seconds} s" for name, seconds in times]
+
+ghenv = None # set by Grasshopper components for runtime messages, warnings are printed when None
+_warning_capture = threading.local() # messages collected by utils.warn for the cached stages
+
+@contextmanager
+def _capture_warnings(quiet: bool = False) -> Iterator[List[str]]:
+    """Collects the messages passed to utils.warn on this thread, so they can be kept with a cached value
+
+    Messages still reach the enclosing capture and are shown as usual.
+
+    Args:
+        quiet (bool): Only collect the messages, e.g. on a worker thread which can't show them
+
+    Yields:
+        Iterator[List[str]]: The messages warned while the context is open
+    """
+    previous = getattr(_warning_capture, "messages", None)
+    previous_quiet = getattr(_warning_capture, "quiet", False)
+    messages: List[str] = []
+    _warning_capture.messages = messages
+    _warning_capture.quiet = previous_quiet or quiet
+    try:
+        yield messages
+    finally:
+        _warning_capture.messages = previous
+        _warning_capture.quiet = previous_quiet
+        if previous is not None:
+            previous.extend(messages)
 
 def get_results_folder(ghdoc: Any) -> Path:
     """_summary_
@@ -109,11 +173,22 @@ class LouverSettings():
     angle: float
     direction: bool
 
+@dataclass
+class ContextSettings():
+    mode: str = "faces" # "faces": one Shade per face, "mesh": one ShadeMesh per geometry, "merged": coplanar neighbours joined
+    merge_tolerance: Optional[float] = None # distance within which faces are joined in "merged" mode (default: model tolerance)
+    cull_distance: Optional[float] = None # drop geometry further than this from every window
+    min_altitude: Optional[float] = None # drop geometry seen below this angle (degrees) from the lowest window
+    cull_back_faces: bool = False # drop faces of closed geometry facing away from every window
+    lod_tiers: Optional[List[tuple[float, str]]] = None # ascending (max distance to rooms, MeshingParameters name), e.g. DEFAULT_LOD_TIERS
+
+DEFAULT_LOD_TIERS = [(30.0, "FastRenderMesh"), (150.0, "Coarse"), (math.inf, "Minimal")]
+
 def create_hb_model(
         ghenv: Any, # RhinoCodePlatform.Rhino3D.GH1.Legacy.ProxyScriptEnv,
         room_geo: List[Brep],
-        construction_sets: List[ConstructionSet],
-        programs: List[ProgramType],
+        construction_sets: List[heath_deps.ConstructionSet],
+        programs: List[heath_deps.ProgramType],
         adj_srf: List[Brep],
         energy_systems: List[str],
         window_geo: List[Surface],
@@ -121,46 +196,569 @@ def create_hb_model(
         louver_settings: Optional[LouverSettings],
         context_geo: List[Union[Mesh, Brep]],
         model_name: str,
-    ) -> tuple[Model, List[str]]:
-    
-    time_report = []
-    s = t()
-    rooms = _create_hb_rooms(room_geo, construction_sets, programs, adj_srf, energy_systems)
-    e = t()
-    time_report.append(f"Created HB rooms in {e-s} s")
-    if window_geo:
-        s = t()
-        apertures = _create_hb_apertures(window_geo)
-        rooms = _add_subfaces(rooms, apertures)
-        e = t()
-        time_report.append(f"Created HB apertures in {e-s} s")
-    elif window_settings:
-        s = t()
-        ws = window_settings
-        apertures = _auto_hb_apertures(rooms, ws.window_wall_ratio, ws.window_height, ws.sill_height, ws.horizontal_separation)
-        e = t()
-        time_report.append(f"Created auto HB apertures in {e-s} s")
-    else:
+        use_cache: bool = True,
+        context_settings: Optional[ContextSettings] = None,
+        trace: Optional[Trace] = None,
+        model_cache_folder: Optional[str] = None,
+        room_keys: Optional[List[str]] = None,
+        adj_srf_bc: str = "Adiabatic",
+        shared_hvac: bool = False,
+        typical_rooms: bool = False,
+        geometry_hashes: Optional[Dict[int, str]] = None,
+    ) -> tuple[heath_deps.Model, List[str]]:
+    """Creates a HB model from Rhino geometry
+
+    Each stage (rooms, apertures, window shades, context) is memoized on a content
+    hash of its inputs, so changing one input only rebuilds the stages depending on it.
+    The stages modify the rooms in place; rooms are only copied when they are held by
+    the cache. The returned model shares its rooms and shades with the cache, so
+    duplicate it before modifying it.
+
+    Args:
+        use_cache (bool): Reuse stage results from previous calls when inputs are unchanged
+        context_settings (Optional[ContextSettings]): How context geometry is turned into shades
+        trace (Optional[Trace]): Trace to record stage and sub-stage spans in, e.g. to export
+            with trace.export(get_results_folder(ghdoc))
+        model_cache_folder (Optional[str]): Folder to keep built models in across Rhino sessions,
+            e.g. get_results_folder(ghdoc). A model built from the same inputs by the same heath
+            version is loaded from there instead of being rebuilt, unless its stages are still in
+            the stage cache. New models are written in the background, see flush_model_cache.
+        room_keys (Optional[List[str]]): Stable keys of the room geometry, stored in the room
+            user_data (default: the index of the geometry). With keys, the unsplit room geometry
+            is stored there too, which update_hb_model needs to update the model.
+        adj_srf_bc (str): Boundary condition of room faces on the adj_srf guide surfaces
+        shared_hvac (bool): Give rooms with the same energy system one shared HVAC object
+            instead of one each, which makes the HBJSON and the EnergyPlus model smaller
+        typical_rooms (bool): Replace rooms which are vertical copies of each other on the
+            typical floors of a tower by one room with a multiplier (see
+            _group_typical_rooms and typical_room_map). The model can't be updated with update_hb_model.
+        geometry_hashes (Optional[Dict[int, str]]): geometry_hash of input geometry by id(), e.g.
+            from start_build, so it isn't hashed again
+
+    Returns:
+        tuple[Model, List[str]]: The model and a time report (one line per stage)
+    """
+    globals()["ghenv"] = ghenv # used by utils.warn in the stages
+    trace = trace if trace is not None else Trace()
+    cache = _get_stage_cache() if use_cache else None
+    def cached(key, build):
+        if cache is None:
+            heath_trace.count(cached=False)
+            return build()
+        def build_with_warnings():
+            with _capture_warnings() as messages:
+                value = build()
+            return value, messages
+        (value, messages), hit = cache.get_or_build(key, build_with_warnings)
+        if hit: # the warnings of the stage, as if it was built again
+            for msg in messages:
+                utils.warn(ghenv, msg)
+        heath_trace.count(cached=hit)
+        return value
+
+    def own(rooms):
+        # stages mutate the rooms they get; rooms kept in the cache are copied first
+        return [room.duplicate() for room in rooms] if cache is not None else rooms
+
+    with trace.activate(), _capture_warnings() as warnings:
+        load_dependencies()
+        conversions = heath_deps.get_conversion_cache()
+        conversion_hits, conversion_misses = conversions.hits, conversions.misses
+        with trace.span("Hashed inputs"):
+            # each geometry is hashed once, the stage and model keys are built from these
+            geo_hashes = _hash_geometry((room_geo, adj_srf, window_geo, context_geo), geometry_hashes)
+            def hashes(geo_list):
+                return [geo_hashes[id(geo)] for geo in geo_list or []]
+            rooms_key = content_hash("rooms", hashes(room_geo), construction_sets, programs, hashes(adj_srf), energy_systems, room_keys,
+                adj_srf_bc, shared_hvac, heath_deps.tolerance, heath_deps.angle_tolerance)
+            ws = window_settings
+            if window_geo:
+                apertures_key = content_hash("apertures", rooms_key, hashes(window_geo))
+            elif ws:
+                apertures_key = content_hash("auto_apertures", rooms_key,
+                    ws.window_wall_ratio, ws.window_height, ws.sill_height, ws.horizontal_separation)
+            else:
+                raise Exception("Either window geo or window settings are required inputs")
+            shades_key = content_hash("window_shades", apertures_key, ws.wall_thickness if ws else None, louver_settings)
+            trace.count(geometry=len(geo_hashes))
+        if model_cache_folder:
+            disk_cache = _get_model_disk_cache(model_cache_folder)
+            model_key = content_hash("model", heath_globals.version, rooms_key, hashes(window_geo), window_settings, louver_settings,
+                hashes(context_geo), model_name, context_settings, typical_rooms)
+        # rooms with their window shades in memory are cheaper to reuse than reading the model file
+        if model_cache_folder and not (cache is not None and shades_key in cache):
+            with trace.span("Checked model cache"):
+                data = disk_cache.get(model_key)
+                hb_model = heath_deps.Model.from_dict(data["model"]) if isinstance(data, dict) and "model" in data else None
+                trace.count(cached=hb_model is not None)
+            if hb_model is not None:
+                for msg in data.get("warnings", []):
+                    utils.warn(ghenv, msg)
+                return hb_model, trace.report()
+
+        with trace.span("Created HB rooms"):
+            rooms = cached(rooms_key, lambda: _create_hb_rooms(room_geo, construction_sets, programs, adj_srf, energy_systems, room_keys,
+                adj_srf_bc, shared_hvac))
+            trace.count(**_count_objects(rooms))
+        if window_geo:
+            with trace.span("Created HB apertures"):
+                rooms = cached(apertures_key, lambda: _add_subfaces(own(rooms), _create_hb_apertures(window_geo), mutate=True))
+                trace.count(**_count_objects(rooms))
+        else:
+            with trace.span("Created auto HB apertures"):
+                def build_auto_apertures():
+                    apt_rooms = own(rooms)
+                    _auto_hb_apertures(apt_rooms, ws.window_wall_ratio, ws.window_height, ws.sill_height, ws.horizontal_separation)
+                    return apt_rooms
+                rooms = cached(apertures_key, build_auto_apertures)
+                trace.count(**_count_objects(rooms))
+
+        with trace.span("Created window shades"):
+            rooms = cached(shades_key, lambda: _add_window_shades(own(rooms), window_settings, louver_settings, mutate=True))
+            trace.count(**_count_objects(rooms))
+
+        with trace.span("Created context"):
+            view_box = _aperture_box(rooms)
+            context_geo, culled = _cull_context(context_geo, view_box, context_settings)
+            for msg in culled:
+                trace.note(msg)
+            cull_box = view_box if context_settings and context_settings.cull_back_faces else None
+            meshing = _context_meshing(context_geo, rooms, context_settings)
+            context, back_faces = cached(content_hash("context", hashes(context_geo), context_settings, cull_box, meshing, heath_deps.tolerance, heath_deps.angle_tolerance),
+                lambda: _add_shades(context_geo, context_settings, cull_box, meshing) if (context_geo) else ([], 0))
+            if back_faces:
+                trace.note(f"Culled {back_faces} context faces facing away from all windows")
+            trace.count(geometry=len(context_geo), culled=len(culled), culled_faces=back_faces, shades=len(context))
+
+        if typical_rooms:
+            with trace.span("Grouped typical rooms"):
+                rooms = cached(content_hash("typical_rooms", shades_key), lambda: _group_typical_rooms(own(rooms), mutate=True))
+
+        with trace.span("Created HB model"):
+            hb_model = _generate_hb_model(model_name, rooms, None, context)
+
+        reused, converted = conversions.hits - conversion_hits, conversions.misses - conversion_misses
+        if reused:
+            trace.note(f"Reused {reused} of {reused + converted} Rhino geometry conversions")
+
+        if model_cache_folder and not os.path.isfile(disk_cache.path(model_key)):
+            _save_model_cache(disk_cache, model_key, hb_model, list(warnings))
+
+    return hb_model, trace.report()
+
+def update_hb_model(
+        ghenv: Any,
+        model: heath_deps.Model,
+        changed_geo: Dict[str, Union[Brep, heath_deps.Polyface3D]],
+        removed_keys: List[str],
+        construction_sets: List[heath_deps.ConstructionSet],
+        programs: List[heath_deps.ProgramType],
+        adj_srf: List[Brep],
+        energy_systems: List[str],
+        window_geo: List[Surface],
+        window_settings: Optional[WindowSettings],
+        louver_settings: Optional[LouverSettings],
+        trace: Optional[Trace] = None,
+        adj_srf_bc: str = "Adiabatic",
+        shared_hvac: bool = False,
+    ) -> tuple[heath_deps.Model, List[str]]:
+    """Updates a model from create_hb_model when only some room geometry changed
+
+    Rooms are matched on the keys in their user_data, so the model must be built with
+    room_keys. Changed rooms are rebuilt, removed ones dropped, and their neighbours (rooms
+    touching the old or new geometry) are rebuilt from the unsplit geometry kept in their
+    user_data. The rebuilt rooms are split by the unsplit geometry of the rooms touching
+    them, as Room.intersect_adjacency does, and get adjacency, guide surface boundary
+    conditions, apertures and window shades again. Rooms touching the neighbours only get
+    their adjacency to them solved again. Other rooms and the context are reused as they
+    are. Headless, where full builds intersect rooms with Room.intersect_adjacency too, the
+    result is the same as a full build with the new geometry. In Rhino, full builds
+    intersect the Breps with intersect_solids, which can split faces differently within
+    tolerance. Rooms are copied before they are changed, so the input model (and the stage
+    cache sharing its rooms) is not modified. Models built with typical_rooms are not
+    supported, their removed rooms can't be matched.
+
+    Args:
+        model (Model): Model to update
+        changed_geo (Dict[str, Union[Brep, Polyface3D]]): New geometry by room key, unknown keys add rooms
+        removed_keys (List[str]): Keys of rooms to remove
+        construction_sets (List[ConstructionSet]): For the changed rooms, one or one per changed room
+        programs (List[ProgramType]): For the changed rooms, one or one per changed room
+        adj_srf (List[Brep]): Guide surfaces, as for create_hb_model
+        energy_systems (List[str]): For the changed rooms, one or one per changed room
+        window_geo (List[Surface]): Windows, as for create_hb_model, only the ones touching updated rooms are used
+        window_settings (Optional[WindowSettings]): As for create_hb_model
+        louver_settings (Optional[LouverSettings]): As for create_hb_model
+        trace (Optional[Trace]): Trace to record spans in
+        adj_srf_bc (str): Boundary condition of room faces on the guide surfaces
+        shared_hvac (bool): Put changed rooms on the shared HVAC of their system type in the model
+
+    Returns:
+        tuple[Model, List[str]]: The updated model and a time report
+    """
+    globals()["ghenv"] = ghenv
+    trace = trace if trace is not None else Trace()
+    if not window_geo and not window_settings:
         raise Exception("Either window geo or window settings are required inputs")
+    gone_keys = set(changed_geo) | set(removed_keys)
+
+    with trace.activate():
+        load_dependencies()
+        with trace.span("Created HB rooms"):
+            new_rooms = _create_rooms(list(changed_geo.values()), [])
+            _set_room_keys(new_rooms, list(changed_geo))
+            _set_room_sources(new_rooms, list(changed_geo.values()))
+            if construction_sets:
+                _apply_energy_property(new_rooms, construction_sets, "construction_set", mutate=True)
+            if programs:
+                _apply_energy_property(new_rooms, programs, "program_type", mutate=True)
+            if energy_systems:
+                hvacs = {room.properties.energy.hvac.equipment_type: room.properties.energy.hvac for room in model.rooms
+                    if shared_hvac and hasattr(room.properties.energy.hvac, "equipment_type")}
+                _set_energy_systems(new_rooms, energy_systems, mutate=True, shared=shared_hvac, hvacs=hvacs)
+            trace.count(rooms=len(new_rooms))
+
+        with trace.span("Found neighbours"):
+            gone = [room for room in model.rooms if _room_key(room) in gone_keys]
+            gone_ids = {room.identifier for room in gone}
+            kept = [room for room in model.rooms if room.identifier not in gone_ids]
+            grid = heath_deps.BoxGrid([heath_deps.polyface_box(room.geometry, heath_deps.tolerance) for room in gone + new_rooms])
+            neighbours = {room.identifier: _rebuild_room(room) for room in kept if grid.query(heath_deps.polyface_box(room.geometry))}
+            # rooms touching the neighbours keep their faces, only their adjacency to the neighbours is solved again
+            outer = {}
+            if neighbours:
+                grid = heath_deps.BoxGrid([heath_deps.polyface_box(room.geometry, heath_deps.tolerance) for room in neighbours.values()])
+                outer = {room.identifier: room.duplicate() for room in kept
+                    if room.identifier not in neighbours and grid.query(heath_deps.polyface_box(room.geometry))}
+            for room in outer.values():
+                _reset_neighbour_faces(room, gone_ids | set(neighbours))
+            affected = new_rooms + list(neighbours.values())
+
+            new_by_key = {_room_key(room): room for room in new_rooms}
+            rooms = []
+            for room in model.rooms:
+                key = _room_key(room)
+                if key in new_by_key:
+                    rooms.append(new_by_key.pop(key))
+                elif key not in gone_keys:
+                    rooms.append(neighbours.get(room.identifier) or outer.get(room.identifier) or room)
+            rooms.extend(new_by_key.values())
+            trace.count(removed=len(gone), neighbours=len(neighbours), outer=len(outer))
+
+        with trace.span("Solved adjacency"):
+            _split_rooms(affected, rooms)
+            _solve_adjacency(affected + list(outer.values()), mutate=True)
+            if adj_srf:
+                # outer rooms too, adjacency may have paired their guide faces with a rebuilt neighbour
+                _update_boundary_conditions(affected + list(outer.values()), adj_srf, adj_srf_bc, mutate=True)
+
+        if window_geo:
+            with trace.span("Created HB apertures"):
+                affected_grid = heath_deps.BoxGrid([heath_deps.polyface_box(room.geometry, heath_deps.tolerance) for room in affected])
+                apertures = [apt for apt in _create_hb_apertures(window_geo) if affected_grid.query(heath_deps.face_box(apt.geometry))]
+                _add_subfaces(affected, apertures, mutate=True)
+        else:
+            with trace.span("Created auto HB apertures"):
+                ws = window_settings
+                _auto_hb_apertures(affected, ws.window_wall_ratio, ws.window_height, ws.sill_height, ws.horizontal_separation)
+        with trace.span("Created window shades"):
+            _add_window_shades(affected, window_settings, louver_settings, mutate=True)
+            trace.count(**_count_objects(affected))
+
+        with trace.span("Created HB model"):
+            hb_model = _generate_hb_model(model.display_name, rooms, None,
+                list(model.orphaned_shades) + list(model.shade_meshes))
+
+    return hb_model, trace.report()
+
+class BuildJob():
+    """A create_hb_model call running on a worker thread
+
+    Progress of the stages is kept in progress and passed to the listeners, which are
+    called on the worker thread. Cancelling stops the build at the next progress report
+    of a stage, without storing anything in the stage cache. The worker never calls the
+    Grasshopper API: warnings of the build are kept in warnings and added to the component
+    when result is read on another thread, e.g. in the solve of the component.
 
-    s = t()
-    rooms = _add_window_shades(rooms, window_settings, louver_settings)
-    e = t()
-    time_report.append(f"Created window shades in {e-s} s")
+    Args:
+        ghenv (Any): Grasshopper environment, as for create_hb_model
+        args (tuple): Positional arguments of create_hb_model after ghenv
+        kwargs (Dict[str, Any]): Keyword arguments of create_hb_model
+        key (Optional[str]): Hash of the inputs, used by start_build to find running builds
+        on_done (Optional[Callable[[BuildJob], None]]): Called when the build finished or failed, not when cancelled
+        listeners (Optional[List[Callable[[str, int, int], None]]]): Called with (stage, done, total) on progress,
+            from the first report on
+    """
+    def __init__(self, ghenv: Any, args: tuple, kwargs: Dict[str, Any], key: Optional[str] = None,
+            on_done: Optional[Callable[["BuildJob"], None]] = None,
+            listeners: Optional[List[Callable[[str, int, int], None]]] = None):
+        self.key = key
+        self.progress: Dict[str, tuple[int, int]] = {}
+        self.stage: Optional[str] = None
+        self.warnings: List[str] = []
+        self.error: Optional[Exception] = None
+        self._result: Optional[tuple[heath_deps.Model, List[str]]] = None
+        self._ghenv, self._args, self._kwargs = ghenv, args, kwargs
+        self._on_done = on_done
+        self._listeners: List[Callable[[str, int, int], None]] = list(listeners or [])
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="heath build", daemon=True)
+
+    @property
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def result(self) -> Optional[tuple[heath_deps.Model, List[str]]]:
+        """The model and time report once the build is done
+
+        Read outside the worker thread, the warnings of the build are added to the component
+        of ghenv (or printed when it is None), as create_hb_model would have done.
+        """
+        if self._result is not None and threading.current_thread() is not self._thread:
+            for msg in self.warnings:
+                utils.warn(self._ghenv, msg)
+        return self._result
 
-    s = t()
-    context = _add_shades(context_geo) if (context_geo) else []
-    e = t()
-    time_report.append(f"Created context in {e-s} s")
+    def start(self) -> "BuildJob":
+        self._thread.start()
+        return self
 
-    s = t()
-    hb_model = _generate_hb_model(model_name, rooms, None, context)
-    e = t()
-    time_report.append(f"Created HB model in {e-s} s")
+    def cancel(self) -> None:
+        self._cancel.set()
 
-    return hb_model, time_report
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def add_listener(self, listener: Callable[[str, int, int], None]) -> None:
+        """Adds a function called with (stage, done, total) on progress
+
+        A running job calls it with the latest progress right away, so no report is missed.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self.stage is not None:
+                listener(self.stage, *self.progress[self.stage])
+
+    def _report(self, stage: str, done: int, total: int) -> None:
+        with self._lock:
+            self.stage = stage
+            self.progress[stage] = (done, total)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(stage, done, total)
+
+    def _run(self) -> None:
+        trace = self._kwargs.pop("trace", None) or Trace()
+        trace.on_progress, trace.cancel_event = self._report, self._cancel
+        try:
+            # no ghenv, the warnings are kept for the UI thread instead of being added here
+            with _capture_warnings(quiet=True) as warnings:
+                self.warnings = warnings
+                self._result = create_hb_model(None, *self._args, trace=trace, **self._kwargs)
+        except BuildCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished.set()
+        if self._on_done is not None and not self.cancelled:
+            self._on_done(self)
+
+_GEOMETRY_ARGS = ("room_geo", "adj_srf", "window_geo", "context_geo")
+
+def _hash_geometry(geo_lists: Iterable[Optional[List[Any]]], known: Optional[Dict[int, str]] = None) -> Dict[int, str]:
+    """geometry_hash of each geometry by id(), reusing the known hashes"""
+    known = known or {}
+    return {id(geo): known.get(id(geo)) or heath_deps.geometry_hash(geo) for geo_list in geo_lists for geo in geo_list or []}
+
+def start_build(ghenv: Any, *args: Any, on_done: Optional[Callable[[BuildJob], None]] = None,
+        listeners: Optional[List[Callable[[str, int, int], None]]] = None, **kwargs: Any) -> BuildJob:
+    """Runs create_hb_model in the background, e.g. from a Grasshopper component
+
+    A running build for other inputs is cancelled and the new one starts right away. The
+    job for the same inputs is returned as is, so a component can call this on every
+    solve and output job.result once job.done. Without on_done, the component of ghenv is
+    expired when the build is done, which solves it again to pick up the result.
+
+    The job is keyed on the geometry_hash of each input geometry, which the build reuses
+    instead of hashing the geometry again.
+
+    Args:
+        ghenv (Any): Grasshopper environment, as for create_hb_model
+        args, kwargs: Arguments of create_hb_model after ghenv
+        on_done (Optional[Callable[[BuildJob], None]]): Called on the worker thread when the build is done
+        listeners (Optional[List[Callable[[str, int, int], None]]]): Progress listeners of a new job,
+            added before it starts (see BuildJob.add_listener)
+
+    Returns:
+        BuildJob: The job building the model for these inputs
+    """
+    load_dependencies()
+    inputs = inspect.signature(create_hb_model).bind(ghenv, *args, **kwargs).arguments
+    geo_hashes = _hash_geometry([inputs.get(name) for name in _GEOMETRY_ARGS], inputs.get("geometry_hashes"))
+    key = content_hash("build", {name: [geo_hashes[id(geo)] for geo in value or []] if name in _GEOMETRY_ARGS else value
+        for name, value in inputs.items() if name not in ("ghenv", "trace", "geometry_hashes")})
+    job: Optional[BuildJob] = sticky.get("heath_build_job")
+    if job is not None and job.key == key and not job.cancelled:
+        for listener in listeners or []:
+            job.add_listener(listener)
+        return job
+    if job is not None and not job.done:
+        job.cancel()
+    if on_done is None and ghenv is not None and Rhino is not None:
+        on_done = lambda _: _expire_component(ghenv)
+    job = BuildJob(ghenv, args, dict(kwargs, geometry_hashes=geo_hashes), key, on_done, listeners)
+    sticky["heath_build_job"] = job
+    return job.start()
+
+def _expire_component(ghenv: Any) -> None:
+    """Expires a Grasshopper component from a worker thread"""
+    from System import Action # type: ignore
+    Rhino.RhinoApp.InvokeOnUiThread(Action(lambda: ghenv.Component.ExpireSolution(True)))
+
+def _set_room_keys(rooms: List[heath_deps.Room], keys: List[str]) -> None:
+    for room, key in zip(rooms, keys):
+        room.user_data = dict(room.user_data or {}, heath_key=str(key))
+
+def _room_key(room: heath_deps.Room) -> Optional[str]:
+    return (room.user_data or {}).get("heath_key")
+
+def _set_room_sources(rooms: List[heath_deps.Room], room_geo: List[Union[Brep, heath_deps.Polyface3D]]) -> None:
+    """Stores the unsplit geometry of rooms in their user_data, update_hb_model rebuilds neighbours from it"""
+    for room, geo in zip(rooms, room_geo):
+        polyface = heath_deps.to_polyface3d_patched(geo)
+        room.user_data = dict(room.user_data or {}, heath_source={
+            "vertices": [list(pt.to_array()) for pt in polyface.vertices],
+            "face_indices": [[list(loop) for loop in face] for face in polyface.face_indices]}) # as it reads back from JSON
+
+def _room_source(room: heath_deps.Room) -> heath_deps.Polyface3D:
+    """Unsplit geometry of a room
 
-def _create_hb_rooms(room_geo: List[Brep], construction_sets: List[ConstructionSet], programs: List[ProgramType], adj_srf: List[Brep], energy_systems: List[str]) -> List[Room]:
+    Raises:
+        ValueError: The room was built without room_keys, so its unsplit geometry wasn't stored
+    """
+    source = (room.user_data or {}).get("heath_source")
+    if source is None:
+        raise ValueError(f"Room {room.display_name} has no unsplit geometry, build the model with room_keys to update it")
+    return heath_deps.Polyface3D(tuple(heath_deps.Point3D(*v) for v in source["vertices"]),
+        [tuple(tuple(loop) for loop in face) for face in source["face_indices"]])
+
+def _rebuild_room(room: heath_deps.Room) -> heath_deps.Room:
+    """Creates a room again from its unsplit geometry, without apertures and adjacency
+
+    Args:
+        room (Room): Room to rebuild, it is not modified
+
+    Returns:
+        Room: Room with the same identifier, user_data, multiplier and extension properties
+    """
+    new_room = room.duplicate() # names, user_data, multiplier, story and extension properties (construction set, program, HVAC)
+    unsplit = _room_from_polyface(room.identifier, _room_source(room))
+    new_room._faces, new_room._geometry = unsplit.faces, unsplit.geometry # replaced as Room.remove_duplicate_faces does
+    for face in new_room.faces:
+        face._parent = new_room
+    return new_room
+
+def _split_rooms(rooms: List[heath_deps.Room], all_rooms: List[heath_deps.Room]) -> None:
+    """Splits rooms by the unsplit geometry of the rooms touching them, like Room.intersect_adjacency
+
+    Args:
+        rooms (List[Room]): Unsplit rooms to split, they are mutated
+        all_rooms (List[Room]): All rooms of the model, in model order
+    """
+    with heath_trace.span("intersection", rooms=len(rooms)):
+        grid = heath_deps.BoxGrid([heath_deps.polyface_box(room.geometry, heath_deps.tolerance) for room in all_rooms])
+        for k, room in enumerate(rooms):
+            heath_trace.progress("intersection", k, len(rooms))
+            others = [_room_source(all_rooms[i]) for i in grid.query(heath_deps.polyface_box(room.geometry)) if all_rooms[i] is not room]
+            room.coplanar_split(others, heath_deps.tolerance, heath_deps.angle_tolerance)
+            room.remove_duplicate_faces(heath_deps.tolerance)
+        heath_trace.progress("intersection", len(rooms), len(rooms))
+
+def _reset_neighbour_faces(room: heath_deps.Room, affected_ids: set) -> None:
+    """Resets faces of a room which are adjacent to updated rooms
+
+    Args:
+        room (Room): Room next to the updated rooms, it is mutated
+        affected_ids (set): Identifiers of the removed, changed and rebuilt rooms
+    """
+    for face in room.faces:
+        bc = face.boundary_condition
+        if isinstance(bc, heath_deps.SurfaceBC) and bc.boundary_condition_objects[-1] in affected_ids:
+            face.boundary_condition = heath_deps.get_bc_from_position(face.geometry.boundary, heath_deps.tolerance)
+
+def _count_objects(rooms: List[heath_deps.Room]) -> Dict[str, int]:
+    """Counts rooms, faces, apertures and aperture shades for trace counters
+
+    Args:
+        rooms (List[Room]): Rooms to count
+
+    Returns:
+        Dict[str, int]: Counts by object type
+    """
+    faces = [face for room in rooms for face in room.faces]
+    apertures = [apt for face in faces for apt in face.apertures]
+    return {
+        "rooms": len(rooms),
+        "faces": len(faces),
+        "apertures": len(apertures),
+        "shades": sum(len(apt.outdoor_shades) for apt in apertures),
+    }
+
+def _get_stage_cache() -> LRUCache:
+    """Gets the stage cache, which is kept in sc.sticky to survive recomputes
+
+    Returns:
+        LRUCache: Cache of stage results keyed on content hashes of their inputs
+    """
+    cache = sticky.get("heath_stage_cache")
+    if cache is None or cache.max_size != heath_globals.stage_cache_size:
+        cache = LRUCache(heath_globals.stage_cache_size)
+        sticky["heath_stage_cache"] = cache
+    return cache
+
+def _get_model_disk_cache(folder: str) -> DiskCache:
+    """Gets the on-disk model cache in a folder
+
+    Args:
+        folder (str): Folder to keep the models in
+
+    Returns:
+        DiskCache: Cache of model dictionaries written by this heath version
+    """
+    return DiskCache(folder, heath_globals.version, heath_globals.model_cache_size_mb * 2**20,
+        heath_globals.model_cache_max_age_days, prefix="heath_model_")
+
+_model_cache_writes: List[Future] = []
+_model_cache_lock = threading.Lock()
+
+def _save_model_cache(disk_cache: DiskCache, key: str, model: heath_deps.Model, warnings: List[str]) -> None:
+    """Writes a model to the disk cache on a background thread, off the interactive path
+
+    The model shares its rooms with the stage cache, which are not modified after the build.
+    """
+    with _model_cache_lock:
+        executor = sticky.get("heath_model_cache_writer")
+        if executor is None: # one thread, so writes of the same key don't race
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="heath model cache")
+            sticky["heath_model_cache_writer"] = executor
+        _model_cache_writes[:] = [f for f in _model_cache_writes if not f.done()]
+        _model_cache_writes.append(executor.submit(lambda: disk_cache.put(key, {"model": model.to_dict(), "warnings": warnings})))
+
+def flush_model_cache() -> None:
+    """Waits until the models of finished builds are written to the model_cache_folder"""
+    with _model_cache_lock:
+        writes = list(_model_cache_writes)
+    wait(writes)
+
+def _create_hb_rooms(room_geo: List[Brep], construction_sets: List[heath_deps.ConstructionSet], programs: List[heath_deps.ProgramType], adj_srf: List[Brep], energy_systems: List[str], room_keys: Optional[List[str]] = None, adj_srf_bc: str = "Adiabatic", shared_hvac: bool = False) -> List[heath_deps.Room]:
     """_summary_
 
     Args:
@@ -169,19 +767,29 @@ def _create_hb_rooms(room_geo: List[Brep], construction_sets: List[ConstructionS
         programs (List[ProgramType]): _description_
         adj_srf (List[Brep]): Breps representing surfaces which should have an adiabatic boundary condition
         windows (List[Brep]): Window surfaces
+        room_keys (Optional[List[str]]): Stable keys stored in the room user_data (default: geometry index)
+        adj_srf_bc (str): Boundary condition of faces on adj_srf
+        shared_hvac (bool): One HVAC object per energy system instead of one per room
     Returns:
         List[Room]: _description_
     """
     room_solids = _intersect_room_geometry(room_geo)
     names = [] # todo: allow room names as input
     rooms = _create_rooms(room_solids, names)
-    _apply_energy_property(rooms, construction_sets, "construction_set", mutate=True)
-    _apply_energy_property(rooms, programs, "program_type", mutate=True)
-    rooms = _solve_adjacency(rooms)
+    _set_room_keys(rooms, room_keys or [str(i) for i in range(len(rooms))])
+    if room_keys is not None: # only models built with keys are updated, the sources make the HBJSON larger
+        _set_room_sources(rooms, room_geo) # before the intersection, for update_hb_model
+    if heath_deps.intersect_solids is None:
+        rooms = _intersect_rooms(rooms)
+    if construction_sets:
+        _apply_energy_property(rooms, construction_sets, "construction_set", mutate=True)
+    if programs:
+        _apply_energy_property(rooms, programs, "program_type", mutate=True)
+    rooms = _solve_adjacency(rooms, mutate=True)
     if adj_srf:
-        rooms = _update_boundary_conditions(rooms, adj_srf)
+        rooms = _update_boundary_conditions(rooms, adj_srf, adj_srf_bc, mutate=True)
     if energy_systems:
-        rooms = _set_energy_systems(rooms, energy_systems)
+        rooms = _set_energy_systems(rooms, energy_systems, mutate=True, shared=shared_hvac)
     
     return rooms
 
@@ -194,11 +802,51 @@ def _intersect_room_geometry(room_geo: List[Brep]) -> List[Brep]:
     Returns:
         List[Brep]: _description_
     """
-    bounding_boxes = [bounding_box(brep) for brep in room_geo]
-    room_solids = intersect_solids(room_geo, bounding_boxes)
+    if heath_deps.intersect_solids is None: # headless, rooms are intersected by _intersect_rooms instead
+        return room_geo
+    with heath_trace.span("intersection", rooms=len(room_geo)):
+        bounding_boxes = [heath_deps.bounding_box(brep) for brep in room_geo]
+        boxes = [utils.to_box(bb) for bb in bounding_boxes]
+        # rooms in different components can't touch, so each component is intersected on its own
+        components = [c for c in heath_deps.overlap_components(boxes, heath_deps.tolerance) if len(c) > 1]
+        heath_trace.count(components=len(components))
+
+        def intersect_component(component: List[int]) -> List[Brep]:
+            return heath_deps.intersect_solids([room_geo[i] for i in component], [bounding_boxes[i] for i in component])
+
+        room_solids = list(room_geo)
+        with ThreadPoolExecutor(max_workers=heath_deps.recommended_processor_count()) as pool:
+            for k, (component, solids) in enumerate(zip(components, pool.map(intersect_component, components))):
+                heath_trace.progress("intersection", k + 1, len(components))
+                for i, solid in zip(component, solids):
+                    room_solids[i] = solid
     return room_solids
 
-def _create_rooms(room_solids: List[Brep], names: List[str]) -> List[Room]:
+def _intersect_rooms(rooms: List[heath_deps.Room]) -> List[heath_deps.Room]:
+    """Intersects the faces of adjacent rooms with honeybee, used when Rhino is unavailable
+
+    Args:
+        rooms (List[Room]): Rooms to intersect, they are mutated
+
+    Returns:
+        List[Room]: The intersected rooms
+    """
+    with heath_trace.span("intersection", rooms=len(rooms)):
+        boxes = [heath_deps.polyface_box(room.geometry) for room in rooms]
+        components = heath_deps.overlap_components(boxes, heath_deps.tolerance)
+        for k, component in enumerate(components):
+            heath_trace.progress("intersection", k, len(components))
+            if len(component) > 1:
+                heath_deps.Room.intersect_adjacency([rooms[i] for i in component], heath_deps.tolerance, heath_deps.angle_tolerance)
+        heath_trace.progress("intersection", len(components), len(components))
+    return rooms
+
+def _room_from_polyface(name: str, polyface: heath_deps.Polyface3D) -> heath_deps.Room:
+    roof_angle = 60 # default from HB
+    floor_angle = 180 - roof_angle # default from HB
+    return heath_deps.Room.from_polyface3d(name, polyface, roof_angle=roof_angle, floor_angle=floor_angle, ground_depth=heath_deps.tolerance)
+
+def _create_rooms(room_solids: List[Union[Brep, heath_deps.Polyface3D]], names: List[str]) -> List[heath_deps.Room]:
     """_summary_
 
     Args:
@@ -209,33 +857,36 @@ def _create_rooms(room_solids: List[Brep], names: List[str]) -> List[Room]:
         List[Room]: _description_
     """
     rooms = []
-    roof_angle = 60 # default from HB
-    floor_angle = 180 - roof_angle # default from HB
 
     for i, geo in enumerate(room_solids):
-        display_name = 'Room_{}'.format(document_counter('room_count')) \
+        heath_trace.progress("rooms", i, len(room_solids))
+        display_name = 'Room_{}'.format(heath_deps.document_counter('room_count')) \
             if len(names) != len(room_solids) else \
             names[i]        
-        name = clean_and_id_string(display_name)
+        name = heath_deps.clean_and_id_string(display_name)
 
 
         # create the Room
-        room = Room.from_polyface3d(
-            name, to_polyface3d_patched(geo), roof_angle=roof_angle,
-            floor_angle=floor_angle, ground_depth=tolerance)
+        with heath_trace.span("polyface conversion"):
+            polyface = heath_deps.to_polyface3d_patched(geo)
+            heath_trace.count(faces=len(polyface.faces))
+        room = _room_from_polyface(name, polyface)
         room.display_name = display_name
 
         # check that the Room geometry is closed.
-        if room.check_solid(tolerance, angle_tolerance, False) != '':
+        with heath_trace.span("check_solid"):
+            solid_msg = room.check_solid(heath_deps.tolerance, heath_deps.angle_tolerance, False)
+        if solid_msg != '':
             msg = 'Input _geo is not a closed volume.\n' \
                 'Room volume must be closed to access most honeybee features.\n' \
                 'Preview the output Room to see the holes in your model.'
             print(msg)
             utils.warn(ghenv, msg) # type: ignore
         rooms.append(room)
+    heath_trace.progress("rooms", len(room_solids), len(room_solids))
     return rooms
 
-def _apply_energy_property(rooms: List[Room], data: Any, key: str, mutate: bool = False) -> List[Room]:
+def _apply_energy_property(rooms: List[heath_deps.Room], data: Any, key: str, mutate: bool = False) -> List[heath_deps.Room]:
     """Sets an energy property for input rooms
 
     Args:
@@ -252,49 +903,68 @@ def _apply_energy_property(rooms: List[Room], data: Any, key: str, mutate: bool
         setattr(room.properties.energy, key, data_pt)
     return rooms
 
-def _solve_adjacency(rooms: List[Room]) -> List[Room]:
+def _solve_adjacency(rooms: List[heath_deps.Room], mutate: bool = False) -> List[heath_deps.Room]:
     """_summary_
 
     Args:
         rooms (List[Room]): _description_
+        mutate (bool): Modify the input rooms in place instead of copying them
 
     Returns:
         List[Room]: _description_
     """
-    adj_rooms = [room.duplicate() for room in rooms]
-    adj_info = Room.solve_adjacency(adj_rooms, tolerance)
+    adj_rooms = rooms if mutate else [room.duplicate() for room in rooms]
+    with heath_trace.span("adjacency", rooms=len(adj_rooms)):
+        adj_info = heath_deps.solve_adjacency(adj_rooms, heath_deps.tolerance)
+        heath_trace.count(adjacent_faces=len(adj_info['adjacent_faces']))
     # report all of the adjacency information
     for adj_face in adj_info['adjacent_faces']:
         print('"{}" is adjacent to "{}"'.format(adj_face[0], adj_face[1]))
     return adj_rooms
 
-def _update_boundary_conditions(rooms: List[Room], adj_srf: List[Brep], bc: str = "Adiabatic") -> List[Room]:
-    """_summary_
+def _update_boundary_conditions(rooms: List[heath_deps.Room], adj_srf: List[Brep], bc: Union[str, Any] = "Adiabatic", mutate: bool = False) -> List[heath_deps.Room]:
+    """Sets the boundary condition of room faces touching and coplanar with guide surfaces
 
     Args:
         rooms (List[Room]): _description_
         adj_srf (List[Brep]): surfaces which should have bc
-        bc(str): boundary condition (default: "Adiabatic")
+        bc (Union[str, Any]): boundary condition name (e.g. "Adiabatic", "Outdoors", "Ground") or object
+        mutate (bool): Modify the input rooms in place instead of copying them
 
     Returns:
         List[Room]: _description_
     """
-    mod_rooms = [room.duplicate() for room in rooms]
-    guide_faces = [g for geo in adj_srf for g in to_face3d_patched(geo)]  # convert to lb geometry
-    for room in mod_rooms:
-        select_faces: List[Face] = room.faces_by_guide_surface(
-            guide_faces, tolerance=tolerance, angle_tolerance=angle_tolerance
-        )
-        for hb_face in select_faces:
-            hb_face.boundary_condition = boundary_conditions.by_name(bc)
+    mod_rooms = rooms if mutate else [room.duplicate() for room in rooms]
+    bc = heath_deps.boundary_conditions.by_name(bc) if isinstance(bc, str) else bc
+    with heath_trace.span("guide surfaces"):
+        guide_faces = [g for geo in adj_srf for g in heath_deps.to_face3d_patched(geo)]  # convert to lb geometry
+        index = heath_deps.GuideIndex(guide_faces, heath_deps.tolerance, math.radians(heath_deps.angle_tolerance))
+        assigned = 0
+        for k, room in enumerate(mod_rooms):
+            heath_trace.progress("guide surfaces", k, len(mod_rooms))
+            select_faces: List[heath_deps.Face] = index.faces_by_guide_surface(room)
+            for hb_face in select_faces:
+                hb_face.boundary_condition = bc
+            assigned += len(select_faces)
+        heath_trace.progress("guide surfaces", len(mod_rooms), len(mod_rooms))
+        heath_trace.count(guides=len(guide_faces), faces=assigned, bc=str(bc))
     return mod_rooms
 
-def _set_energy_systems(rooms: List[Room], energy_system_ids: List[str]) -> List[Room]:
+def _set_energy_systems(
+        rooms: List[heath_deps.Room],
+        energy_system_ids: List[str],
+        mutate: bool = False,
+        shared: bool = False,
+        hvacs: Optional[Dict[str, Any]] = None,
+    ) -> List[heath_deps.Room]:
     """_summary_
 
     Args:
         rooms (List[Room]): _description_
         energy_system_ids (List[str]): _description_
+        mutate (bool): Modify the input rooms in place instead of copying them
+        shared (bool): Rooms with the same system type get one HVAC object instead of one each
+        hvacs (Optional[Dict[str, Any]]): Shared HVAC objects by equipment type to reuse, it is updated
 
     Raises:
         ValueError: _description_
@@ -302,36 +972,56 @@ def _set_energy_systems(rooms: List[Room], energy_system_ids: List[str]) -> List
     Returns:
         List[Room]: _description_
     """
-    rooms = [room.duplicate() for room in rooms]
+    if not mutate:
+        rooms = [room.duplicate() for room in rooms]
     
     # dictionary of HVAC template names
-    ext_folder = hb_energy_config_folders.standards_extension_folders[0]
-    hvac_reg = os.path.join(ext_folder, 'hvac_registry.json')
-    with open(hvac_reg, 'r') as f:
-        hvac_dict = json.load(f)
-        for i, room in enumerate(rooms):
-            
-            rpe: RoomEnergyProperties = room.properties.energy
-            rpe.add_default_ideal_air()
-
-            system_type = energy_system_ids[i] if len(rooms) == len(energy_system_ids) else energy_system_ids[0]
-            # process any input properties for the HVAC system
-            try:  # get the class for the HVAC system
-                try:
-                    sys_id = hvac_dict[system_type]
-                except KeyError:
-                    sys_id = system_type
-            except KeyError:
-                raise ValueError('System Type "{}" is not recognized as a HeatCool HVAC '
-                    'system.'.format(system_type))
-            
-            name = clean_and_id_ep_string('Heat-Cool HVAC')
-            hvac_class = EQUIPMENT_TYPES_DICT[sys_id]
+    hvac_dict = _get_hvac_registry()
+    hvacs = {} if hvacs is None else hvacs
+    for i, room in enumerate(rooms):
+        
+        rpe: heath_deps.RoomEnergyProperties = room.properties.energy
+        rpe.add_default_ideal_air()
+
+        system_type = energy_system_ids[i] if len(rooms) == len(energy_system_ids) else energy_system_ids[0]
+        # process any input properties for the HVAC system
+        sys_id = hvac_dict.get(system_type, system_type)
+        if sys_id not in heath_deps.EQUIPMENT_TYPES_DICT:
+            raise ValueError('System Type "{}" is not recognized as a HeatCool HVAC '
+                'system.'.format(system_type))
+        
+        hvac = hvacs.get(sys_id) if shared else None
+        if hvac is None:
+            name = heath_deps.clean_and_id_ep_string('Heat-Cool HVAC')
+            hvac_class = heath_deps.EQUIPMENT_TYPES_DICT[sys_id]
             hvac = hvac_class(name, "ASHRAE_2019", sys_id)
-            rpe.hvac = hvac
+            hvacs[sys_id] = hvac
+        rpe.hvac = hvac
+    heath_trace.count(hvacs=len({id(room.properties.energy.hvac) for room in rooms}))
     return rooms
 
-def _create_hb_apertures(window_geo: List[Surface]) -> List[Aperture]:
+def _get_hvac_registry() -> Dict[str, str]:
+    """Gets the HVAC template names of the honeybee standards
+
+    The parsed hvac_registry.json is kept in sc.sticky and only read again when the file changes.
+
+    Returns:
+        Dict[str, str]: Equipment types by template name, empty without a standards folder
+    """
+    folders = heath_deps.hb_energy_config_folders.standards_extension_folders
+    hvac_reg = os.path.join(folders[0], 'hvac_registry.json') if folders else None
+    stamp = os.stat(hvac_reg).st_mtime_ns if hvac_reg and os.path.isfile(hvac_reg) else None
+    cached = sticky.get("heath_hvac_registry")
+    if cached is not None and cached[:2] == (hvac_reg, stamp):
+        return cached[2]
+    hvac_dict = {}
+    if stamp is not None:
+        with open(hvac_reg, 'r') as f:
+            hvac_dict = json.load(f)
+    sticky["heath_hvac_registry"] = (hvac_reg, stamp, hvac_dict)
+    return hvac_dict
+
+def _create_hb_apertures(window_geo: List[Surface]) -> List[heath_deps.Aperture]:
     """_summary_
 
     Args:
@@ -343,18 +1033,18 @@ def _create_hb_apertures(window_geo: List[Surface]) -> List[Aperture]:
     apertures = []
     
     for geo in window_geo:
-        name = clean_and_id_string("Aperture")
-        lb_faces = to_face3d_patched(geo)
+        name = heath_deps.clean_and_id_string("Aperture")
+        lb_faces = heath_deps.to_face3d_patched(geo)
         for j, lb_face in enumerate(lb_faces):
             ap_name = f"{name}_{j}"
-            ap = Aperture(ap_name, lb_face)
+            ap = heath_deps.Aperture(ap_name, lb_face)
             ap.display_name = ap_name
             apertures.append(ap)
     
     return apertures
 
 
-def _auto_hb_apertures(rooms: List[Room], window_wall_ratio: float, window_height: float, sill_height: float, horizontal_separation: float) -> List[Aperture]:
+def _auto_hb_apertures(rooms: List[heath_deps.Room], window_wall_ratio: float, window_height: float, sill_height: float, horizontal_separation: float) -> List[heath_deps.Aperture]:
     """_summary_
 
     Args:
@@ -372,15 +1062,78 @@ def _auto_hb_apertures(rooms: List[Room], window_wall_ratio: float, window_heigh
     horizontal_separation = 3.0 if horizontal_separation is None else horizontal_separation
         
     apertures = []
-    for room in rooms:
-        face: Face
-        for face in room.faces:
-            if isinstance(face.boundary_condition, Outdoors) and isinstance(face.type, Wall):
-                face.apertures_by_ratio_rectangle(window_wall_ratio, window_height, sill_height, horizontal_separation)
-                apertures.extend(face.apertures)
+    # walls which are moved or rotated (about z) copies of each other get the same layout,
+    # kept in the wall's frame and mapped onto each copy
+    layouts: Dict[tuple, List[tuple]] = {}
+    walls, hits = 0, 0
+    with heath_trace.span("aperture layout"):
+        for k, room in enumerate(rooms):
+            heath_trace.progress("apertures", k, len(rooms))
+            face: heath_deps.Face
+            for face in room.faces:
+                if isinstance(face.boundary_condition, heath_deps.Outdoors) and isinstance(face.type, heath_deps.Wall):
+                    walls += 1
+                    frame = heath_deps.wall_frame(face.geometry, 0.01) if window_wall_ratio else None # 0.01: tolerance of apertures_by_ratio_rectangle
+                    if frame is None:
+                        face.apertures_by_ratio_rectangle(window_wall_ratio, window_height, sill_height, horizontal_separation)
+                        apertures.extend(face.apertures)
+                        continue
+                    key = (_layout_key(face.geometry, frame), window_wall_ratio, window_height, sill_height, horizontal_separation)
+                    layout = layouts.get(key)
+                    if layout is None:
+                        face.apertures_by_ratio_rectangle(window_wall_ratio, window_height, sill_height, horizontal_separation)
+                        layouts[key] = [heath_deps.face_to_frame(apt.geometry, frame) for apt in face.apertures]
+                    else:
+                        hits += 1
+                        face.remove_sub_faces()
+                        for i, local in enumerate(layout):
+                            face.add_aperture(heath_deps.Aperture('{}_Glz{}'.format(face.identifier, i), heath_deps.face_from_frame(local, frame)))
+                    apertures.extend(face.apertures)
+        heath_trace.progress("apertures", len(rooms), len(rooms))
+        heath_trace.count(walls=walls, layouts=len(layouts), layout_hits=hits,
+            layout_hit_rate=hits / walls if walls else 0.0)
     return apertures
 
-def _add_border_shades(apt: Aperture, depth: float) -> List[Aperture]:
+def _layout_key(geo: heath_deps.Face3D, frame: heath_deps.Frame) -> tuple:
+    """Wall shape in its frame, rounded far below the tolerance so equal keys give the same layout
+
+    Also holds the sides honeybee picks for a window rectangle, see _rectangle_sides.
+
+    Args:
+        geo (Face3D): Wall geometry
+        frame (Frame): Frame from wall_frame
+
+    Returns:
+        tuple: Rounded frame coordinates of the boundary and holes
+    """
+    def rel(points):
+        return tuple(tuple(round(c, 6) for c in heath_deps.to_frame(p, frame)) for p in points)
+    return rel(geo.boundary), tuple(rel(hole) for hole in geo.holes) if geo.has_holes else (), _rectangle_sides(geo)
+
+def _rectangle_sides(geo: heath_deps.Face3D) -> Optional[tuple]:
+    """Boundary indices of the vertical edges Face3D.extract_rectangle would use as the sides of a window rectangle
+
+    They are sorted on world x (or y), so they differ between walls which are rotated copies of each other
+
+    Args:
+        geo (Face3D): Wall geometry
+
+    Returns:
+        Optional[tuple]: Indices of the left and right edge, () with less than two vertical edges
+    """
+    try:
+        geo = geo.remove_colinear_vertices(0.01) # as in apertures_by_ratio_rectangle
+    except AssertionError:
+        return None
+    segments = geo.boundary_segments
+    vertical = [i for i, seg in enumerate(segments) if seg.is_vertical(0.01)]
+    if len(vertical) < 2:
+        return ()
+    axis = 1 if abs(geo.normal.x) == 1 else 0
+    vertical.sort(key=lambda i: segments[i].p[axis])
+    return vertical[0], vertical[-1]
+
+def _add_border_shades(apt: heath_deps.Aperture, depth: float) -> List[heath_deps.Aperture]:
     """_summary_
 
     Args:
@@ -390,11 +1143,11 @@ def _add_border_shades(apt: Aperture, depth: float) -> List[Aperture]:
     Returns:
         List[Aperture]: _description_
     """
-    if isinstance(apt.boundary_condition, Outdoors):
+    if isinstance(apt.boundary_condition, heath_deps.Outdoors):
         apt.extruded_border(depth)
     return apt
 
-def _add_louver_shades(apt: Aperture, depth: float, count: int, dist: float, angle: float, direction: bool) -> List[Aperture]:
+def _add_louver_shades(apt: heath_deps.Aperture, depth: float, count: int, dist: float, angle: float, direction: bool) -> List[heath_deps.Aperture]:
     """_summary_
 
     Args:
@@ -408,7 +1161,7 @@ def _add_louver_shades(apt: Aperture, depth: float, count: int, dist: float, ang
     Returns:
         List[Aperture]: _description_
     """
-    vec = Vector2D(*((1,0) if not direction else (0, 1)))
+    vec = heath_deps.Vector2D(*((1,0) if not direction else (0, 1)))
     if not dist:
         louvers = apt.louvers_by_count(count, depth, 0, angle, vec)
     else:
@@ -416,34 +1169,50 @@ def _add_louver_shades(apt: Aperture, depth: float, count: int, dist: float, ang
     
     return apt
 
-def _add_subfaces(rooms: List[Room], apertures: List[Aperture]) -> List[Room]:
+def _add_subfaces(rooms: List[heath_deps.Room], apertures: List[heath_deps.Aperture], mutate: bool = False) -> List[heath_deps.Room]:
     """_summary_
 
     Args:
         rooms (List[Room]): _description_
         apertures (List[Aperture]): _description_
+        mutate (bool): Modify the input rooms and apertures in place instead of copying them
 
     Returns:
         List[Room]: _description_
     """
-    rooms = [r.duplicate() for r in rooms]
-    apertures = [a.duplicate() for a in apertures]
+    if not mutate:
+        rooms = [r.duplicate() for r in rooms]
+        apertures = [a.duplicate() for a in apertures]
     
     apt_ids = [apt.identifier for apt in apertures]
     added_ids = set()
 
-    for room in rooms:
-        face: Face
-        for face in room.faces:
-            for i, apt in enumerate(apertures):
-                if face.geometry.is_sub_face(apt.geometry, tolerance, angle_tolerance):
-                    if apt.identifier in added_ids:
-                        apt = apt.duplicate()
-                        apt.add_prefix("Ajd") # no idea what this is
-                    added_ids.add(apt.identifier)
-                    apt_ids[i] = None
-                    
-                    face.add_aperture(apt)
+    # broad phase: only faces whose bounding box touches the aperture and whose plane
+    # agrees with it get the exact is_sub_face check
+    faces: List[heath_deps.Face] = [face for room in rooms for face in room.faces]
+    with heath_trace.span("aperture matching", faces=len(faces), apertures=len(apertures)):
+        grid = heath_deps.BoxGrid([heath_deps.face_box(face.geometry, heath_deps.tolerance) for face in faces])
+        matches = []
+        for i, apt in enumerate(apertures):
+            heath_trace.progress("apertures", i, len(apertures))
+            for j in grid.query(heath_deps.face_box(apt.geometry)):
+                face_geo = faces[j].geometry
+                if heath_deps.maybe_coplanar(face_geo, apt.geometry, heath_deps.tolerance, heath_deps.angle_tolerance) and \
+                        face_geo.is_sub_face(apt.geometry, heath_deps.tolerance, heath_deps.angle_tolerance):
+                    matches.append((j, i))
+        heath_trace.progress("apertures", len(apertures), len(apertures))
+        heath_trace.count(matches=len(matches))
+
+    # add in room/face/aperture order, same as testing every aperture against every face
+    for j, i in sorted(matches):
+        apt = apertures[i]
+        if apt.identifier in added_ids:
+            apt = apt.duplicate()
+            apt.add_prefix("Ajd") # no idea what this is
+        added_ids.add(apt.identifier)
+        apt_ids[i] = None
+
+        faces[j].add_aperture(apt)
 
     unmatched_ids = [apt_id for apt_id in apt_ids if apt_id is not None]
     if len(unmatched_ids):
@@ -452,63 +1221,300 @@ def _add_subfaces(rooms: List[Room], apertures: List[Aperture]) -> List[Room]:
 
     return rooms
 
-def _add_window_shades(rooms: List[Room], window_settings: WindowSettings, louver_settings: LouverSettings ) -> List[Room]:
+def _add_window_shades(rooms: List[heath_deps.Room], window_settings: WindowSettings, louver_settings: LouverSettings, mutate: bool = False) -> List[heath_deps.Room]:
     """_summary_
 
     Args:
         rooms (List[Room]): _description_
         window_settings (WindowSettings): _description_
         louver_settings (LouverSettings): _description_
+        mutate (bool): Modify the input rooms in place instead of copying them
 
     Returns:
         List[Room]: _description_
     """
-    rooms = [r.duplicate() for r in rooms]
-    for room in rooms:
-        face: Face
-        for face in room.faces:
-            for apt in face.apertures:
-                _add_border_shades(apt, window_settings.wall_thickness)
-                if louver_settings:
-                    ls = louver_settings
-                    _add_louver_shades(apt, ls.depth, ls.count, ls.dist, ls.angle, ls.direction)
+    if not mutate:
+        rooms = [r.duplicate() for r in rooms]
+    with heath_trace.span("louvers" if louver_settings else "border shades"):
+        # apertures which are translated copies of each other get the same shades, moved into place
+        templates: Dict[tuple, tuple[heath_deps.Point3D, List[tuple[str, heath_deps.Face3D]]]] = {}
+        hits = 0
+        for k, room in enumerate(rooms):
+            heath_trace.progress("window shades", k, len(rooms))
+            face: heath_deps.Face
+            for face in room.faces:
+                for apt in face.apertures:
+                    key = _shade_template_key(apt)
+                    template = templates.get(key)
+                    if template is None:
+                        first = len(apt.outdoor_shades)
+                        _add_border_shades(apt, window_settings.wall_thickness)
+                        if louver_settings:
+                            ls = louver_settings
+                            _add_louver_shades(apt, ls.depth, ls.count, ls.dist, ls.angle, ls.direction)
+                        templates[key] = (apt.geometry.vertices[0],
+                            [(shd.identifier[len(apt.identifier):], shd.geometry) for shd in apt.outdoor_shades[first:]])
+                    else:
+                        hits += 1
+                        origin, shades = template
+                        move = apt.geometry.vertices[0] - origin
+                        apt.add_outdoor_shades([heath_deps.Shade(apt.identifier + suffix, geo.move(move)) for suffix, geo in shades])
+        heath_trace.progress("window shades", len(rooms), len(rooms))
+        heath_trace.count(**_count_objects(rooms), shade_templates=len(templates), template_hits=hits)
     return rooms
 
-def _add_shades(geo_list: List[Union[Mesh, Brep]]) -> List[Shade]:
+def _shade_template_key(apt: heath_deps.Aperture) -> tuple:
+    """Key which is equal for apertures that are translated copies of each other
+
+    Vertices are taken relative to the first vertex and rounded to the model tolerance.
+
+    Args:
+        apt (Aperture): Aperture to get the key of
+
+    Returns:
+        tuple: Shape key, including whether the aperture gets border shades
+    """
+    geo: heath_deps.Face3D = apt.geometry
+    o = geo.vertices[0]
+    def rel(points):
+        return tuple((round((p.x - o.x) / heath_deps.tolerance), round((p.y - o.y) / heath_deps.tolerance), round((p.z - o.z) / heath_deps.tolerance))
+            for p in points)
+    holes = tuple(rel(hole) for hole in geo.holes) if geo.has_holes else ()
+    return (rel(geo.boundary), holes, isinstance(apt.boundary_condition, heath_deps.Outdoors))
+
+def _aperture_box(rooms: List[heath_deps.Room]) -> Optional[heath_deps.Box]:
+    """Bounding box of all apertures of the rooms
+
+    Args:
+        rooms (List[Room]): Rooms with apertures
+
+    Returns:
+        Optional[Box]: Box around the apertures or None if there are none
+    """
+    boxes = [heath_deps.face_box(apt.geometry) for room in rooms for face in room.faces for apt in face.apertures]
+    return heath_deps.union_box(boxes) if boxes else None
+
+def _cull_context(geo_list: List[Union[Mesh, Brep]], view_box: Optional[heath_deps.Box], context_settings: Optional[ContextSettings]) -> tuple[List[Union[Mesh, Brep]], List[str]]:
+    """Removes context geometry which can't shade any window
+
+    Geometry is dropped when it is further than context_settings.cull_distance from
+    the windows or when it is seen below context_settings.min_altitude from the lowest window.
+
+    Args:
+        geo_list (List[Union[Mesh, Brep]]): Context geometry
+        view_box (Optional[Box]): Bounding box of the windows, nothing is culled if None
+        context_settings (Optional[ContextSettings]): Culling settings
+
+    Returns:
+        tuple[List[Union[Mesh, Brep]], List[str]]: Kept geometry and a report line per culled geometry
+    """
+    cs = context_settings
+    if not geo_list or view_box is None or cs is None or (cs.cull_distance is None and cs.min_altitude is None):
+        return geo_list, []
+    kept, culled = [], []
+    for i, geo in enumerate(geo_list):
+        box = utils.geo_box(geo)
+        if cs.cull_distance is not None and heath_deps.box_distance(box, view_box) > cs.cull_distance:
+            culled.append(f"Culled context geometry {i}: further than {cs.cull_distance} from all windows")
+        elif cs.min_altitude is not None and heath_deps.elevation_angle(box, view_box) < math.radians(cs.min_altitude):
+            culled.append(f"Culled context geometry {i}: below {cs.min_altitude} degrees seen from the windows")
+        else:
+            kept.append(geo)
+    return kept, culled
+
+def _context_meshing(geo_list: List[Union[Mesh, Brep]], rooms: List[heath_deps.Room], context_settings: Optional[ContextSettings]) -> Optional[List[str]]:
+    """Picks the meshing parameters of each context geometry from its distance to the rooms
+
+    Args:
+        geo_list (List[Union[Mesh, Brep]]): Context geometry
+        rooms (List[Room]): Modeled rooms
+        context_settings (Optional[ContextSettings]): Settings with the level of detail tiers
+
+    Returns:
+        Optional[List[str]]: MeshingParameters names per geometry or None to use meshing_parameters for all
+    """
+    if not geo_list or not rooms or context_settings is None or not context_settings.lod_tiers:
+        return None
+    tiers = sorted(context_settings.lod_tiers, key=lambda tier: tier[0])
+    rooms_box = heath_deps.union_box([heath_deps.polyface_box(room.geometry) for room in rooms])
+    meshing = []
+    for geo in geo_list:
+        dist = heath_deps.box_distance(utils.geo_box(geo), rooms_box)
+        meshing.append(next((name for max_dist, name in tiers if dist <= max_dist), tiers[-1][1]))
+    return meshing
+
+def _add_shades(geo_list: List[Union[Mesh, Brep]], context_settings: Optional[ContextSettings] = None, cull_box: Optional[heath_deps.Box] = None, meshing: Optional[List[str]] = None) -> tuple[List[Union[heath_deps.Shade, heath_deps.ShadeMesh]], int]:
     """_summary_
 
     Args:
         geo (List[Brep]): _description_
+        context_settings (Optional[ContextSettings]): Mode for aggregating the faces of each geometry
+        cull_box (Optional[Box]): Box around the windows, faces of closed geometry facing away from it are dropped
+        meshing (Optional[List[str]]): MeshingParameters names per geometry (default: meshing_parameters)
 
     Returns:
-        List[Shade]: _description_
+        tuple[List[Union[Shade, ShadeMesh]], int]: Shades and the number of culled faces
     """
+    mode = context_settings.mode if context_settings else "faces"
+    if mode not in ("faces", "mesh", "merged"):
+        raise ValueError(f'Context mode "{mode}" is not recognized, use "faces", "mesh" or "merged"')
     shades = []
+    back_faces = 0
     for i, geo in enumerate(geo_list):
-        name = clean_and_id_string("Shade")
-        faces = to_face3d_patched(geo, meshing_parameters)
+        heath_trace.progress("context", i, len(geo_list))
+        name = heath_deps.clean_and_id_string("Shade")
+        mesh_par = getattr(mp, meshing[i]) if meshing and mp else meshing_parameters
+        with heath_trace.span("context conversion"):
+            faces = heath_deps.to_face_arrays_patched(geo, mesh_par) # FaceArrays for meshes, Face3Ds are made as needed
+            heath_trace.count(faces=len(faces))
+        if cull_box is not None and utils.is_closed(geo):
+            if isinstance(faces, heath_deps.FaceArrays):
+                front_faces = faces.select(~faces.away_from_box(cull_box))
+            else:
+                front_faces = [face for face in faces if not heath_deps.faces_away_from_box(face, cull_box)]
+            back_faces += len(faces) - len(front_faces)
+            faces = front_faces
+        if not len(faces):
+            continue
+        if mode == "mesh":
+            mesh = faces.to_mesh3d() if isinstance(faces, heath_deps.FaceArrays) else heath_deps.face3ds_to_mesh3d(faces)
+            shd = heath_deps.ShadeMesh(name, mesh, False)
+            shd.display_name = name
+            shades.append(shd)
+            continue
+        if mode == "merged":
+            merge_tolerance = utils.replace_null(context_settings.merge_tolerance, heath_deps.tolerance)
+            faces = heath_deps.merge_coplanar_faces(faces, merge_tolerance, math.radians(heath_deps.angle_tolerance))
         for j, face in enumerate(faces):
-            shd_name = f"{name}_{i}"
-            shd = Shade(shd_name, face, False)
+            shd_name = f"{name}_{i}" if mode == "faces" else f"{name}_{j}"
+            shd = heath_deps.Shade(shd_name, face, False)
             shd.display_name = shd_name
             shades.append(shd)
-    return shades
+    heath_trace.progress("context", len(geo_list), len(geo_list))
+    return shades, back_faces
+
+def _group_typical_rooms(rooms: List[heath_deps.Room], mutate: bool = False) -> List[heath_deps.Room]:
+    """Replaces rooms on typical floors, which are vertical copies of each other, by one room with a multiplier
+
+    Rooms are grouped when they have the same plan position, their faces, apertures and
+    aperture shades match (to tolerance) after moving them to the same height, and they
+    have the same construction set, program, HVAC settings and face boundary condition
+    types. Rooms on the same floor are never grouped. The first room of a group is kept
+    with the group size as multiplier, its user_data lists the rooms it stands for (see
+    typical_room_map). Surface boundary conditions of kept rooms pointing to removed rooms
+    become Adiabatic, as do both faces of Surface pairs between rooms with different
+    multipliers, which EnergyPlus can't match.
+
+    Args:
+        rooms (List[Room]): Rooms with apertures and window shades
+        mutate (bool): Modify the input rooms in place instead of copying them
+
+    Returns:
+        List[Room]: The kept rooms, in input order
+    """
+    if not mutate:
+        rooms = [room.duplicate() for room in rooms]
+    groups: Dict[str, List[heath_deps.Room]] = {}
+    for k, room in enumerate(rooms):
+        heath_trace.progress("typical rooms", k, len(rooms))
+        groups.setdefault(_typical_room_key(room), []).append(room)
+    heath_trace.progress("typical rooms", len(rooms), len(rooms))
+
+    removed = set()
+    for group in groups.values():
+        if len(group) == 1:
+            continue
+        kept_room = group[0]
+        kept_room.multiplier = sum(room.multiplier for room in group)
+        kept_room.user_data = dict(kept_room.user_data or {}, heath_group=[room.identifier for room in group],
+            heath_group_keys=[_room_key(room) for room in group])
+        removed.update(room.identifier for room in group[1:])
+
+    kept = [room for room in rooms if room.identifier not in removed]
+    multipliers = {room.identifier: room.multiplier for room in kept}
+    adiabatic = 0
+    for room in kept:
+        for face in room.faces:
+            bc = face.boundary_condition
+            # removed rooms give None; the other face of a pair is reset when its room comes up
+            if isinstance(bc, heath_deps.SurfaceBC) and multipliers.get(bc.boundary_condition_objects[-1]) != room.multiplier:
+                face.boundary_condition = heath_deps.boundary_conditions.adiabatic
+                adiabatic += 1
+    heath_trace.count(rooms=len(kept), removed=len(removed), groups=sum(len(g) > 1 for g in groups.values()), adiabatic=adiabatic)
+    return kept
+
+def _typical_room_key(room: heath_deps.Room) -> str:
+    """Hash of a room which is the same for rooms that only differ by a vertical translation and identifiers
+
+    Args:
+        room (Room): Room to hash
 
-def _generate_hb_model(name: str, rooms: List[Room], apertures: List[Aperture], shades: List[Shade]) -> Model:
+    Returns:
+        str: Hex digest of the plan position, the geometry relative to the room's bounding box
+            and the energy properties
+    """
+    origin = room.min
+    def coords(geo: heath_deps.Face3D) -> tuple:
+        loops = (geo.boundary,) + tuple(geo.holes or ())
+        return tuple(tuple((round((pt.x - origin.x) / heath_deps.tolerance), round((pt.y - origin.y) / heath_deps.tolerance),
+            round((pt.z - origin.z) / heath_deps.tolerance)) for pt in loop) for loop in loops)
+    def hvac_settings(hvac: Any) -> Optional[Dict[str, Any]]:
+        if hvac is None:
+            return None
+        return {k: v for k, v in hvac.to_dict().items() if k not in ("identifier", "display_name")}
+
+    faces = sorted((
+        type(face.type).__name__,
+        type(face.boundary_condition).__name__,
+        coords(face.geometry),
+        sorted((coords(apt.geometry), sorted(coords(shd.geometry) for shd in apt.outdoor_shades)) for apt in face.apertures),
+    ) for face in room.faces)
+    rpe: heath_deps.RoomEnergyProperties = room.properties.energy
+    return content_hash(
+        (round(origin.x / heath_deps.tolerance), round(origin.y / heath_deps.tolerance)), # typical floors only, not copies on one floor
+        faces,
+        sorted(coords(shd.geometry) for shd in room.outdoor_shades),
+        rpe.construction_set.identifier,
+        rpe.program_type.identifier,
+        hvac_settings(rpe.hvac),
+    )
+
+def typical_room_map(model: heath_deps.Model) -> Dict[str, str]:
+    """Maps the identifiers of the rooms grouped by typical_rooms to the room simulated for them
+
+    Zone results of a kept room apply to each room it stands for, building totals already
+    include the multiplier.
+
+    Args:
+        model (Model): Model built with typical_rooms
+
+    Returns:
+        Dict[str, str]: Identifier of the kept room by identifier of every grouped room, kept rooms included
+    """
+    return {identifier: room.identifier for room in model.rooms
+        for identifier in (room.user_data or {}).get("heath_group", [])}
+
+def _generate_hb_model(name: str, rooms: List[heath_deps.Room], apertures: List[heath_deps.Aperture], shades: List[Union[heath_deps.Shade, heath_deps.ShadeMesh]]) -> heath_deps.Model:
     """_summary_
 
     Args:
         rooms (List[Room]): _description_
         apertures (List[Aperture]): _description_
+        shades (List[Union[Shade, ShadeMesh]]): Context shades, ShadeMeshes are added as model shade meshes
 
     Returns:
         Model: _description_
     """
-    return Model(clean_string(name), rooms, None, shades, apertures, None, None, units_system(), tolerance, angle_tolerance)
+    shade_meshes = [shd for shd in shades if isinstance(shd, heath_deps.ShadeMesh)]
+    shades = [shd for shd in shades if not isinstance(shd, heath_deps.ShadeMesh)]
+    return heath_deps.Model(heath_deps.clean_string(name), rooms, None, shades, apertures, None, shade_meshes, heath_deps.units_system(), heath_deps.tolerance, heath_deps.angle_tolerance)
 
 class heath_globals:
     version = "0.9.1"
     results_folder = "results"
+    stage_cache_size = 16
+    model_cache_size_mb = 500
+    model_cache_max_age_days = 30
 
 class utils:
     # not sure the "@staticmethod" thing is needed anymore in python 3
@@ -518,8 +1524,37 @@ class utils:
 
     @staticmethod
     def warn(ghenv, message):
+        messages = getattr(_warning_capture, "messages", None)
+        if messages is not None: # kept with the cached stage values, see _capture_warnings
+            messages.append(message)
+        if getattr(_warning_capture, "quiet", False): # shown later, see BuildJob.result
+            return
+        if ghenv is None: # headless
+            print(message)
+            return
         ghenv.Component.AddRuntimeMessage(Message.Warning, message)
 
+    @staticmethod
+    def to_box(bb) -> heath_deps.Box:
+        """Converts a Rhino BoundingBox to a heath_geometry Box"""
+        return (bb.Min.X, bb.Min.Y, bb.Min.Z), (bb.Max.X, bb.Max.Y, bb.Max.Z)
+
+    @staticmethod
+    def geo_box(geo) -> heath_deps.Box:
+        """Bounding box of Rhino or ladybug_geometry geometry"""
+        if hasattr(geo, "min") and hasattr(geo, "max"): # Face3D, Polyface3D, Mesh3D
+            return (geo.min.x, geo.min.y, geo.min.z), (geo.max.x, geo.max.y, geo.max.z)
+        return utils.to_box(heath_deps.bounding_box(geo))
+
+    @staticmethod
+    def is_closed(geo) -> bool:
+        """Whether Rhino or ladybug_geometry geometry is a closed volume"""
+        if isinstance(geo, Mesh):
+            return geo.IsClosed
+        if isinstance(geo, heath_deps.Polyface3D):
+            return geo.is_solid
+        return bool(getattr(geo, "IsSolid", False))
+
     @staticmethod
     def replace_null(value, default):
         return value if value is not None else default
@@ -533,4 +1568,65 @@ class utils:
         Returns:
             str: _description_
         """
-        return json.dumps(dict)
\ No newline at end of file
+        return json.dumps(dict)
+
+    @staticmethod
+    def write_hbjson(model: heath_deps.Model, path: str, included_prop: Optional[List[str]] = None, include_plane: bool = True) -> str:
+        """Writes a model as HBJSON one object at a time, without building Model.to_dict()
+
+        The output is the same as json.dumps(model.to_dict(included_prop, False, include_plane)),
+        but only one room or shade is held as a dictionary at a time. Paths ending in .gz are
+        written as a gzip stream.
+
+        Args:
+            model (Model): Model to write
+            path (str): File to write to
+            included_prop (Optional[List[str]]): Extension properties to include, see Model.to_dict
+            include_plane (bool): Include the planes of the Face3Ds
+
+        Returns:
+            str: path
+        """
+        load_dependencies()
+        encoder = json.JSONEncoder()
+        with (gzip.open(path, "wt", encoding="utf-8") if path.endswith(".gz") else open(path, "w", encoding="utf-8")) as f:
+            def write_value(value):
+                f.write(encoder.encode(value))  # one object at a time, with the fast C encoder
+            def write_key(key, first=False):
+                f.write(("{" if first else ", ") + encoder.encode(key) + ": ")
+            def write_list(key, objects, to_dict):
+                if objects:
+                    write_key(key)
+                    f.write("[")
+                    for i, obj in enumerate(objects):
+                        if i:
+                            f.write(", ")
+                        write_value(to_dict(obj))
+                    f.write("]")
+
+            # same keys in the same order as Model.to_dict
+            write_key("type", True)
+            write_value("Model")
+            for key, value in (("identifier", model.identifier), ("display_name", model.display_name),
+                    ("units", model.units), ("properties", model.properties.to_dict(included_prop))):
+                write_key(key)
+                write_value(value)
+            to_dict = lambda obj: obj.to_dict(True, included_prop, include_plane)
+            write_list("rooms", model.rooms, to_dict)
+            write_list("orphaned_faces", model.orphaned_faces, to_dict)
+            write_list("orphaned_apertures", model.orphaned_apertures, to_dict)
+            write_list("orphaned_doors", model.orphaned_doors, to_dict)
+            write_list("orphaned_shades", model.orphaned_shades, to_dict)
+            write_list("shade_meshes", model.shade_meshes, lambda obj: obj.to_dict(True, included_prop))
+            optional = [("tolerance", model.tolerance if model.tolerance != 0 else None),
+                ("angle_tolerance", model.angle_tolerance if model.angle_tolerance != 0 else None),
+                ("user_data", model.user_data),
+                ("version", heath_deps.hb_config_folders.honeybee_schema_version_str if heath_deps.hb_config_folders.honeybee_schema_version is not None else None)]
+            for key, value in optional:
+                if value is not None:
+                    write_key(key)
+                    write_value(value)
+            f.write("}")
+        return path
+
+_import_times.append(("heath", perf_counter() - _import_start))
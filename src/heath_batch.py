@@ -0,0 +1,330 @@
+# Copyright (c) 2024, Heath.
+# You should have received a copy of the GNU Affero General Public License
+# along with Heath; If not, see <http://www.gnu.org/licenses/>.
+#
+# @license AGPL-3.0-or-later <https://spdx.org/licenses/AGPL-3.0-or-later>
+
+
+""" Builds HB models from ladybug_geometry input without Rhino, fanning variants out over a process pool
+
+usage: `python heath_batch.py variants.json out_folder -w 8`, where variants.json is a list of
+Variant dictionaries (see Variant.from_dict)
+sweep: `python heath_batch.py sweep.json out_folder --sweep` (see sweep())
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+import io
+import itertools
+import json
+import os
+import random
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from ladybug_geometry.geometry3d.face import Face3D
+from ladybug_geometry.geometry3d.mesh import Mesh3D
+from ladybug_geometry.geometry3d.polyface import Polyface3D
+from honeybee.model import Model
+from honeybee.room import Room
+from honeybee.shade import Shade
+from honeybee.shademesh import ShadeMesh
+from honeybee.typing import clean_string
+from honeybee_energy.constructionset import ConstructionSet
+from honeybee_energy.programtype import ProgramType
+from honeybee_energy.lib.constructionsets import construction_set_by_identifier
+from honeybee_energy.lib.programtypes import program_type_by_identifier
+
+import heath
+from heath import ContextSettings, LouverSettings, WindowSettings
+import heath_trace
+from heath_geometry import face_box, union_box
+
+heath.load_dependencies() # stages are called directly, not only through create_hb_model
+
+_GEOMETRY_TYPES = {"Polyface3D": Polyface3D, "Face3D": Face3D, "Mesh3D": Mesh3D}
+
+
+@dataclass
+class Variant():
+    name: str
+    room_geo: List[Polyface3D]
+    window_geo: List[Face3D] = field(default_factory=list) # drawn windows, used instead of window_settings apertures
+    window_settings: Optional[WindowSettings] = None
+    louver_settings: Optional[LouverSettings] = None
+    adj_srf: List[Face3D] = field(default_factory=list)
+    context_geo: List[Union[Face3D, Mesh3D]] = field(default_factory=list)
+    construction_sets: List[Union[str, ConstructionSet]] = field(default_factory=list) # objects or library identifiers
+    programs: List[Union[str, ProgramType]] = field(default_factory=list) # objects or library identifiers
+    energy_systems: List[str] = field(default_factory=list)
+    context_settings: Optional[ContextSettings] = None
+    adj_srf_bc: str = "Adiabatic"
+    shared_hvac: bool = False
+    typical_rooms: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Variant":
+        """Creates a variant from a dictionary
+
+        Geometry is given as ladybug_geometry dictionaries (Polyface3D, Face3D, Mesh3D),
+        settings as dictionaries of WindowSettings, LouverSettings and ContextSettings
+        fields, construction sets and programs as library identifiers.
+
+        Args:
+            data (Dict[str, Any]): Variant dictionary
+
+        Returns:
+            Variant: _description_
+        """
+        def geo(key):
+            return [_GEOMETRY_TYPES[g["type"]].from_dict(g) for g in data.get(key, [])]
+        def settings(key, settings_class):
+            return settings_class(**data[key]) if data.get(key) else None
+        return cls(
+            name=data["name"],
+            room_geo=geo("room_geo"),
+            window_geo=geo("window_geo"),
+            window_settings=settings("window_settings", WindowSettings),
+            louver_settings=settings("louver_settings", LouverSettings),
+            adj_srf=geo("adj_srf"),
+            context_geo=geo("context_geo"),
+            construction_sets=data.get("construction_sets", []),
+            programs=data.get("programs", []),
+            energy_systems=data.get("energy_systems", []),
+            context_settings=settings("context_settings", ContextSettings),
+            adj_srf_bc=data.get("adj_srf_bc", "Adiabatic"),
+            shared_hvac=data.get("shared_hvac", False),
+            typical_rooms=data.get("typical_rooms", False),
+        )
+
+
+@dataclass
+class BatchResult():
+    name: str
+    path: Optional[str] # written HBJSON file, None if the build failed
+    report: List[str] = field(default_factory=list) # stage time report of create_hb_model
+    log: str = "" # printed output of the build, e.g. adjacency info and warnings
+    error: Optional[str] = None
+    window_settings: Optional[WindowSettings] = None # settings of sweep variants
+    louver_settings: Optional[LouverSettings] = None
+
+
+def build_variant(variant: Variant, folder: str) -> BatchResult:
+    """Builds one variant and writes it as HBJSON, runs in the worker processes
+
+    Args:
+        variant (Variant): Variant to build
+        folder (str): Folder to write the HBJSON file to
+
+    Returns:
+        BatchResult: Path of the written model and the time report
+    """
+    log = io.StringIO()
+    with redirect_stdout(log):
+        model, report = heath.create_hb_model(
+            None,
+            variant.room_geo,
+            [_resolve(c, construction_set_by_identifier) for c in variant.construction_sets],
+            [_resolve(p, program_type_by_identifier) for p in variant.programs],
+            variant.adj_srf,
+            variant.energy_systems,
+            variant.window_geo,
+            variant.window_settings,
+            variant.louver_settings,
+            variant.context_geo,
+            variant.name,
+            use_cache=False,
+            context_settings=variant.context_settings,
+            adj_srf_bc=variant.adj_srf_bc,
+            shared_hvac=variant.shared_hvac,
+            typical_rooms=variant.typical_rooms,
+        )
+        path = heath.utils.write_hbjson(model, os.path.join(folder, f"{clean_string(variant.name)}.hbjson"))
+    return BatchResult(variant.name, path, report, log.getvalue())
+
+
+def run_batch(variants: List[Variant], folder: str, workers: Optional[int] = None) -> Iterator[BatchResult]:
+    """Builds variants in parallel processes, yielding each result as soon as its model is written
+
+    Failed builds are yielded with the error instead of stopping the batch.
+
+    Args:
+        variants (List[Variant]): Variants to build, names are used as file names
+        folder (str): Folder to write the HBJSON files to
+        workers (Optional[int]): Number of processes (default: recommended_processor_count())
+
+    Yields:
+        BatchResult: One result per variant, in order of completion
+    """
+    os.makedirs(folder, exist_ok=True)
+    workers = workers or heath.recommended_processor_count()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(build_variant, variant, folder): variant.name for variant in variants}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield BatchResult(futures[future], None, error=f"{type(e).__name__}: {e}")
+
+
+def sweep(
+        base: Variant,
+        window_settings: List[WindowSettings],
+        louver_settings: List[Optional[LouverSettings]],
+        folder: str,
+        workers: Optional[int] = None,
+        samples: Optional[int] = None,
+        seed: int = 0,
+    ) -> Iterator[BatchResult]:
+    """Builds the rooms and context of base once and evaluates window and louver settings against them
+
+    Rooms (intersection, adjacency, energy properties, systems) and context shades are built
+    once in this process and sent once to every worker. Each variant then only copies the
+    rooms and runs the aperture, window shade and model stages. Drawn windows of base are
+    added once and kept for all variants, only their shades vary. Context is culled
+    against all outdoor walls, so it is valid for every window layout.
+
+    Args:
+        base (Variant): Geometry and energy inputs shared by all variants, its settings are ignored
+        window_settings (List[WindowSettings]): Window settings to combine
+        louver_settings (List[Optional[LouverSettings]]): Louver settings to combine, None for border shades only
+        folder (str): Folder to write the HBJSON files to
+        workers (Optional[int]): Number of processes (default: recommended_processor_count())
+        samples (Optional[int]): Number of combinations to draw at random instead of the full product
+        seed (int): Seed for drawing the samples
+
+    Yields:
+        BatchResult: One result per combination, named {base.name}_{index in the product}
+    """
+    combinations = list(enumerate(itertools.product(window_settings, louver_settings or [None])))
+    if samples is not None and samples < len(combinations):
+        combinations = sorted(random.Random(seed).sample(combinations, samples), key=lambda c: c[0])
+
+    with redirect_stdout(io.StringIO()):
+        rooms, context = _build_sweep_base(base)
+    # sent as a model, so Model.from_dict links rooms to one HVAC object per identifier as in run_batch
+    base_data = (heath._generate_hb_model(base.name, rooms, None, context).to_dict(),)
+
+    os.makedirs(folder, exist_ok=True)
+    workers = workers or heath.recommended_processor_count()
+    with ProcessPoolExecutor(workers, initializer=_init_sweep_worker, initargs=base_data) as pool:
+        futures = {pool.submit(_sweep_variant, f"{base.name}_{i}", ws, ls, bool(base.window_geo), folder, base.typical_rooms): (i, ws, ls)
+            for i, (ws, ls) in combinations}
+        for future in as_completed(futures):
+            i, ws, ls = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = BatchResult(f"{base.name}_{i}", None, error=f"{type(e).__name__}: {e}")
+            result.window_settings, result.louver_settings = ws, ls
+            yield result
+
+
+def _build_sweep_base(base: Variant) -> tuple[List[Room], List[Union[Shade, ShadeMesh]]]:
+    """Builds the rooms, drawn apertures and context shared by all sweep variants
+
+    Args:
+        base (Variant): Shared inputs
+
+    Returns:
+        tuple[List[Room], List[Union[Shade, ShadeMesh]]]: Rooms and context shades
+    """
+    rooms = heath._create_hb_rooms(
+        base.room_geo,
+        [_resolve(c, construction_set_by_identifier) for c in base.construction_sets],
+        [_resolve(p, program_type_by_identifier) for p in base.programs],
+        base.adj_srf,
+        base.energy_systems,
+        adj_srf_bc=base.adj_srf_bc,
+        shared_hvac=base.shared_hvac,
+    )
+    if base.window_geo:
+        rooms = heath._add_subfaces(rooms, heath._create_hb_apertures(base.window_geo), mutate=True)
+    walls = [face_box(face.geometry) for room in rooms for face in room.faces
+        if isinstance(face.boundary_condition, heath.Outdoors) and isinstance(face.type, heath.Wall)]
+    view_box = union_box(walls) if walls else None
+    cs = base.context_settings
+    context_geo, _ = heath._cull_context(base.context_geo, view_box, cs)
+    cull_box = view_box if cs and cs.cull_back_faces else None
+    meshing = heath._context_meshing(context_geo, rooms, cs)
+    context, _ = heath._add_shades(context_geo, cs, cull_box, meshing) if context_geo else ([], 0)
+    return rooms, context
+
+
+_sweep_base: Dict[str, Any] = {} # rooms and context of the sweep, set once per worker process
+
+
+def _init_sweep_worker(model_dict: Dict[str, Any]) -> None:
+    model = Model.from_dict(model_dict)
+    _sweep_base["rooms"] = list(model.rooms)
+    _sweep_base["context"] = list(model.orphaned_shades) + list(model.shade_meshes)
+
+
+def _sweep_variant(name: str, ws: WindowSettings, ls: Optional[LouverSettings], drawn_windows: bool, folder: str,
+        typical_rooms: bool = False) -> BatchResult:
+    """Adds apertures and window shades to a copy of the shared rooms and writes the model
+
+    Args:
+        name (str): Model name
+        ws (WindowSettings): Window settings, only wall_thickness is used with drawn windows
+        ls (Optional[LouverSettings]): Louver settings
+        drawn_windows (bool): The shared rooms already have apertures
+        folder (str): Folder to write the HBJSON file to
+        typical_rooms (bool): Group typical rooms, see create_hb_model
+
+    Returns:
+        BatchResult: Path of the written model and the time report
+    """
+    trace = heath_trace.Trace()
+    log = io.StringIO()
+    with redirect_stdout(log), trace.activate():
+        rooms = [room.duplicate() for room in _sweep_base["rooms"]]
+        if not drawn_windows:
+            with trace.span("Created auto HB apertures"):
+                heath._auto_hb_apertures(rooms, ws.window_wall_ratio, ws.window_height, ws.sill_height, ws.horizontal_separation)
+        with trace.span("Created window shades"):
+            heath._add_window_shades(rooms, ws, ls, mutate=True)
+        if typical_rooms:
+            with trace.span("Grouped typical rooms"):
+                rooms = heath._group_typical_rooms(rooms, mutate=True)
+        with trace.span("Created HB model"):
+            model = heath._generate_hb_model(name, rooms, None, _sweep_base["context"])
+        path = heath.utils.write_hbjson(model, os.path.join(folder, f"{clean_string(name)}.hbjson"))
+    return BatchResult(name, path, trace.report(), log.getvalue())
+
+
+def _resolve(item: Union[str, Any], by_identifier: Any) -> Any:
+    return by_identifier(item) if isinstance(item, str) else item
+
+
+def main(args):
+    with open(args.variants) as f:
+        data = json.load(f)
+    if args.sweep:
+        ws = [WindowSettings(**d) for d in data["window_settings"]]
+        ls = [LouverSettings(**d) if d else None for d in data.get("louver_settings", [None])]
+        total = min(len(ws) * len(ls), data.get("samples") or len(ws) * len(ls))
+        results = sweep(Variant.from_dict(data["base"]), ws, ls, args.folder, args.workers, data.get("samples"), data.get("seed", 0))
+    else:
+        variants = [Variant.from_dict(v) for v in data]
+        total = len(variants)
+        results = run_batch(variants, args.folder, args.workers)
+    failed = 0
+    for i, result in enumerate(results):
+        if result.error:
+            failed += 1
+            print(f"[{i + 1}/{total}] {result.name} failed: {result.error}")
+        else:
+            print(f"[{i + 1}/{total}] {result.name} -> {result.path} ({'; '.join(result.report)})")
+    print(f"built {total - failed} of {total} variants")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("variants", help="json file with a list of variant dictionaries")
+    arg_parser.add_argument("folder", help="folder to write the HBJSON models to")
+    arg_parser.add_argument("-w", "--workers", type=int, help="number of processes")
+    arg_parser.add_argument("--sweep", action="store_true", help="variants file is a sweep: a base variant with lists of "
+        "window_settings and louver_settings (null for none) and optional samples and seed")
+    main(args = arg_parser.parse_args())
@@ -0,0 +1,239 @@
+# Copyright (c) 2024, Heath.
+# You should have received a copy of the GNU Affero General Public License
+# along with Heath; If not, see <http://www.gnu.org/licenses/>.
+#
+# @license AGPL-3.0-or-later <https://spdx.org/licenses/AGPL-3.0-or-later>
+
+
+""" Caching helpers used to skip work between Grasshopper recomputes"""
+
+from collections import OrderedDict
+from dataclasses import astuple, is_dataclass
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+_MISSING = object() # LRUCache lookups return it for missing keys, None is a valid value
+
+
+class LRUCache():
+    """A size-bounded dictionary evicting the least recently used entry.
+
+    Lookups and writes are locked, as builds running on a worker thread share the cache
+    with the Grasshopper thread. Values are built outside the lock.
+
+    Args:
+        max_size (int): Maximum number of entries kept in the cache
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value, _ = self._lookup(key, default)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def _lookup(self, key: Hashable, default: Any) -> Tuple[Any, bool]:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default, False
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value, True
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns the cached value for key, calling build() and storing the result on a miss
+
+        Args:
+            key (Hashable): Cache key
+            build (Callable[[], Any]): Function computing the value
+
+        Returns:
+            Tuple[Any, bool]: The value and whether it came from the cache
+        """
+        value, hit = self._lookup(key, None)
+        if hit:
+            return value, True
+        value = build()
+        self.put(key, value)
+        return value, False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class DiskCache():
+    """JSON documents stored as gzip files in a folder, surviving Rhino restarts.
+
+    Each file starts with a header line holding the version which wrote it and a
+    sha256 digest of the document. Files with another version or a wrong digest are
+    deleted when read. Reading a file marks it as recently used; after each write the
+    least recently used files are removed until the folder is within max_bytes, and
+    files unused for max_age_days are removed as well.
+
+    Args:
+        folder (str): Folder to keep the files in, e.g. get_results_folder(ghdoc)
+        version (str): Version of the writer, entries of other versions are stale
+        max_bytes (int): Maximum total size of the cache files
+        max_age_days (Optional[float]): Remove entries unused for longer than this
+        prefix (str): File name prefix of the cache files
+    """
+    suffix = ".json.gz"
+
+    def __init__(self, folder: str, version: str, max_bytes: int, max_age_days: Optional[float] = None, prefix: str = "heath_cache_"):
+        self.folder = folder
+        self.version = version
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.prefix = prefix
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{self.prefix}{key}{self.suffix}")
+
+    def get(self, key: str) -> Any:
+        """Reads the document stored for key
+
+        Args:
+            key (str): Cache key, e.g. a content_hash of the inputs
+
+        Returns:
+            Any: The document or None if it is missing, stale or corrupt
+        """
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with gzip.open(path, "rb") as f:
+                header = json.loads(f.readline())
+                payload = f.read()
+            if not isinstance(header, dict) or header.get("version") != self.version or hashlib.sha256(payload).hexdigest() != header.get("sha256"):
+                raise ValueError("stale or corrupt cache entry")
+            data = json.loads(payload)
+        except (OSError, EOFError, ValueError, zlib.error):
+            self._remove(path)
+            return None
+        os.utime(path)
+        return data
+
+    def put(self, key: str, data: Any) -> str:
+        """Writes the document for key and evicts old entries
+
+        Args:
+            key (str): Cache key
+            data (Any): JSON serializable document
+
+        Returns:
+            str: Path of the written file
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        payload = json.dumps(data, separators=(",", ":")).encode()
+        header = json.dumps({"version": self.version, "sha256": hashlib.sha256(payload).hexdigest()}).encode()
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(header + b"\n")
+            f.write(payload)
+        os.replace(tmp_path, path)  # readers never see a partly written file
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """Removes expired entries, then the least recently used ones until the cache fits max_bytes"""
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.startswith(self.prefix) and name.endswith(self.suffix):
+                path = os.path.join(self.folder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort(reverse=True)
+        now, total = time.time(), 0
+        for mtime, size, path in entries:
+            if self.max_age_days is not None and now - mtime > self.max_age_days * 86400:
+                self._remove(path)
+                continue
+            total += size
+            if total > self.max_bytes:
+                self._remove(path)
+
+    def clear(self) -> None:
+        for name in os.listdir(self.folder):
+            if name.startswith(self.prefix) and name.endswith(self.suffix):
+                self._remove(os.path.join(self.folder, name))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def content_hash(*items: Any) -> str:
+    """Hashes the content of the input objects
+
+    Supports primitives, lists, tuples, dicts, dataclasses, objects with a
+    to_dict() method (honeybee and ladybug objects) and Rhino geometry.
+
+    Returns:
+        str: Hex digest which only changes when the content changes
+    """
+    h = hashlib.sha1()
+    for item in items:
+        _update_hash(h, item)
+    return h.hexdigest()
+
+
+def _update_hash(h: Any, item: Any) -> None:
+    if item is None or isinstance(item, (str, int, float, bool)):
+        h.update(f"{type(item).__name__}:{item!r};".encode())
+    elif isinstance(item, (list, tuple)):
+        h.update(b"[")
+        for i in item:
+            _update_hash(h, i)
+        h.update(b"]")
+    elif isinstance(item, dict):
+        h.update(b"{")
+        for k in sorted(item, key=str):
+            _update_hash(h, k)
+            _update_hash(h, item[k])
+        h.update(b"}")
+    elif is_dataclass(item):
+        h.update(type(item).__name__.encode())
+        _update_hash(h, astuple(item))
+    elif hasattr(item, "to_dict"):  # ladybug and honeybee objects
+        h.update(json.dumps(item.to_dict(), sort_keys=True).encode())
+    elif hasattr(item, "ToJSON"):  # Rhino geometry
+        from Rhino.FileIO import SerializationOptions # type: ignore
+        h.update(str(item.ToJSON(SerializationOptions())).encode())
+    else:
+        h.update(repr(item).encode())
@@ -0,0 +1,92 @@
+# Copyright (c) 2024, Heath.
+# You should have received a copy of the GNU Affero General Public License
+# along with Heath; If not, see <http://www.gnu.org/licenses/>.
+#
+# @license AGPL-3.0-or-later <https://spdx.org/licenses/AGPL-3.0-or-later>
+
+
+""" The ladybug_rhino, honeybee and heath geometry dependencies of heath, imported by heath.load_dependencies
+
+Importing this module loads the honeybee stack, which takes seconds, so heath only imports
+it for the first build. The names are only imported for heath, whose stages use them as
+attributes, e.g. heath_deps.Room.
+"""
+
+from contextlib import contextmanager
+import os
+from time import perf_counter
+from typing import Iterator, List
+
+import heath_trace
+
+import_times: List[tuple[str, float]] = []
+
+@contextmanager
+def _timed_import(name: str) -> Iterator[None]:
+    start = perf_counter()
+    with heath_trace.span(f"Imported {name}"):
+        yield
+    import_times.append((name, perf_counter() - start))
+
+try:  # ladybug_rhino.grasshopper and .intersect need Rhino and .NET
+    import Rhino # type: ignore
+    _rhino = True
+except ImportError:
+    _rhino = False
+
+try:  # import the ladybug_rhino and honeybee dependencies
+    with _timed_import("ladybug_rhino"):
+        from ladybug_rhino.config import units_system, angle_tolerance, tolerance
+        if _rhino:
+            from ladybug_rhino.grasshopper import document_counter, recommended_processor_count
+            from ladybug_rhino.intersect import bounding_box, intersect_solids
+        else:  # headless, rooms are intersected with Room.intersect_adjacency
+            bounding_box = intersect_solids = None
+            _counters = {}
+
+            def document_counter(counter_name: str) -> int:
+                _counters[counter_name] = _counters.get(counter_name, 0) + 1
+                return _counters[counter_name]
+
+            def recommended_processor_count() -> int:
+                return max(1, (os.cpu_count() or 1) - 1)
+    # MEGA HACK because something changed in the Rhino API rendering HB useless
+    # https://discourse.ladybug.tools/t/ladybug-modules-relying-on-rhino-geometry-collections-seem-not-to-work-in-rhino-8-python-3/25222
+    # from ladybug_rhino.togeometry import to_polyface3d
+
+    with _timed_import("honeybee"):
+        from honeybee_energy.constructionset import ConstructionSet
+        from honeybee_energy.programtype import ProgramType
+        from honeybee.boundarycondition import boundary_conditions, get_bc_from_position, Outdoors
+        from honeybee.boundarycondition import Surface as SurfaceBC
+        from honeybee_energy.hvac.heatcool import EQUIPMENT_TYPES_DICT
+        from honeybee_energy.config import folders as hb_energy_config_folders
+        from honeybee.face import Face
+        from honeybee.facetype import Wall
+        from honeybee.aperture import Aperture
+        from honeybee.model import Model
+        from honeybee.config import folders as hb_config_folders
+        from honeybee.shade import Shade
+        from honeybee.shademesh import ShadeMesh
+        from honeybee.room import Room
+        from honeybee_energy.properties.room import RoomEnergyProperties
+        from honeybee.typing import clean_string, clean_and_id_string, clean_and_id_ep_string
+
+        from ladybug_geometry.geometry2d.pointvector import Vector2D
+        from ladybug_geometry.geometry3d.pointvector import Point3D
+        from ladybug_geometry.geometry3d.face import Face3D
+        from ladybug_geometry.geometry3d.polyface import Polyface3D
+except ImportError as e:
+    raise ImportError('\nFailed to import ladybug_rhino:\n\t{}'.format(e))
+
+with _timed_import("heath_geometry"):
+    from heath_geometry import (
+        Box, BoxGrid, FaceArrays, Frame, GuideIndex, box_distance, elevation_angle, face_box, face_from_frame, face_to_frame,
+        face3ds_to_mesh3d, faces_away_from_box, maybe_coplanar, merge_coplanar_faces, overlap_components, polyface_box,
+        solve_adjacency, to_frame, union_box, wall_frame
+    )
+
+with _timed_import("patch_honeybee"): # heath.load_dependencies reloads it, and this module, when its file changed
+    from patch_honeybee import (
+        geometry_hash, get_conversion_cache, to_polyface3d_patched, to_face3d_patched, to_face_arrays_patched
+    )
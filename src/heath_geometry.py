@@ -0,0 +1,600 @@
+# Copyright (c) 2024, Heath.
+# You should have received a copy of the GNU Affero General Public License
+# along with Heath; If not, see <http://www.gnu.org/licenses/>.
+#
+# @license AGPL-3.0-or-later <https://spdx.org/licenses/AGPL-3.0-or-later>
+
+
+""" Rhino-free geometry helpers (spatial indexes and broad phases) built on ladybug_geometry"""
+
+from collections import defaultdict
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ladybug_geometry.geometry3d.face import Face3D
+from ladybug_geometry.geometry3d.mesh import Mesh3D
+from ladybug_geometry.geometry3d.plane import Plane
+from ladybug_geometry.geometry3d.pointvector import Point3D, Vector3D
+from ladybug_geometry.geometry3d.polyface import Polyface3D
+from honeybee.boundarycondition import Surface
+from honeybee.room import Room
+
+try:
+    import numpy as np
+except ImportError:  # callers fall back to their per-face loops
+    np = None
+
+Box = Tuple[Tuple[float, float, float], Tuple[float, float, float]]
+
+
+def face_box(face: Face3D, pad: float = 0) -> Box:
+    """Axis-aligned bounding box of a Face3D
+
+    Args:
+        face (Face3D): Face to bound
+        pad (float): Distance to inflate the box with in every direction
+
+    Returns:
+        Box: ((min x, min y, min z), (max x, max y, max z))
+    """
+    mn, mx = face.min, face.max
+    return (mn.x - pad, mn.y - pad, mn.z - pad), (mx.x + pad, mx.y + pad, mx.z + pad)
+
+
+def union_box(boxes: Sequence[Box]) -> Box:
+    return (tuple(min(b[0][i] for b in boxes) for i in range(3)),
+        tuple(max(b[1][i] for b in boxes) for i in range(3)))
+
+
+def box_distance(box_1: Box, box_2: Box) -> float:
+    """Shortest distance between two boxes, 0 if they overlap"""
+    (a0, a1), (b0, b1) = box_1, box_2
+    return math.sqrt(sum(max(0.0, a0[i] - b1[i], b0[i] - a1[i]) ** 2 for i in range(3)))
+
+
+def elevation_angle(box: Box, view_box: Box) -> float:
+    """Highest elevation angle (radians) at which box can be seen from inside view_box
+
+    Measured from the lowest point of view_box over the shortest horizontal distance.
+    """
+    (a0, a1), (b0, b1) = box, view_box
+    horizontal = math.sqrt(sum(max(0.0, a0[i] - b1[i], b0[i] - a1[i]) ** 2 for i in range(2)))
+    return math.atan2(a1[2] - b0[2], horizontal)
+
+
+def faces_away_from_box(face: Face3D, box: Box) -> bool:
+    """True if every corner of box lies behind the plane of face"""
+    n, o = face.normal, face.vertices[0]
+    for x in (box[0][0], box[1][0]):
+        for y in (box[0][1], box[1][1]):
+            for z in (box[0][2], box[1][2]):
+                if n.x * (x - o.x) + n.y * (y - o.y) + n.z * (z - o.z) >= 0:
+                    return False
+    return True
+
+
+def boxes_overlap(box_1: Box, box_2: Box, pad: float = 0) -> bool:
+    (a0, a1), (b0, b1) = box_1, box_2
+    return all(a0[i] <= b1[i] + pad and b0[i] <= a1[i] + pad for i in range(3))
+
+
+class BoxGrid():
+    """Uniform grid over axis-aligned bounding boxes.
+
+    Each box is registered in every cell it touches, so a query only has to
+    look at the cells touched by the query box.
+
+    Args:
+        boxes (Sequence[Box]): Boxes to index, queries return their indices
+        cell_size (Optional[float]): Grid spacing. Defaults to the mean box extent
+    """
+    def __init__(self, boxes: Sequence[Box], cell_size: Optional[float] = None):
+        self.boxes = list(boxes)
+        if cell_size is None:
+            extents = [max(b[1][i] - b[0][i] for i in range(3)) for b in self.boxes]
+            cell_size = sum(extents) / len(extents) if extents else 1.0
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self._cells: Dict[Tuple[int, int, int], List[int]] = defaultdict(list)
+        for i, box in enumerate(self.boxes):
+            for cell in self._cells_of(box):
+                self._cells[cell].append(i)
+
+    def _cells_of(self, box: Box) -> Iterable[Tuple[int, int, int]]:
+        lo = [math.floor(v / self.cell_size) for v in box[0]]
+        hi = [math.floor(v / self.cell_size) for v in box[1]]
+        for x in range(lo[0], hi[0] + 1):
+            for y in range(lo[1], hi[1] + 1):
+                for z in range(lo[2], hi[2] + 1):
+                    yield x, y, z
+
+    def query(self, box: Box) -> List[int]:
+        """Indices of the indexed boxes overlapping the input box, in ascending order
+
+        Args:
+            box (Box): Query box
+
+        Returns:
+            List[int]: Indices into the boxes the grid was built from
+        """
+        found = set()
+        for cell in self._cells_of(box):
+            found.update(self._cells.get(cell, ()))
+        return sorted(i for i in found if boxes_overlap(self.boxes[i], box))
+
+
+def maybe_coplanar(face: Face3D, other: Face3D, tolerance: float, angle_tolerance: float) -> bool:
+    """Cheap version of Plane.is_coplanar_tolerance used to discard candidates
+
+    Uses the same criteria as Face3D.is_sub_face: the normals are (anti)parallel
+    within angle_tolerance (radians) and the origin of the other plane lies
+    within tolerance of the plane of face.
+    """
+    pl_1, pl_2 = face.plane, other.plane
+    cos_angle = abs(pl_1.n.dot(pl_2.n))
+    if cos_angle < math.cos(min(angle_tolerance, math.pi / 2)) - 1e-9:
+        return False
+    return abs(pl_1.n.dot(pl_2.o - pl_1.o)) <= tolerance + 1e-9
+
+
+class GuideIndex():
+    """Guide surfaces indexed on their bounding boxes, for Room.faces_by_guide_surface without a direction
+
+    A room face can only match a guide whose box, inflated by the tolerance, touches the
+    face box and whose plane agrees with the face plane, so only those guides get the
+    exact honeybee checks.
+
+    Args:
+        guides (Sequence[Face3D]): Guide surfaces
+        tolerance (float): Model tolerance
+        angle_tolerance (float): Angle tolerance in radians
+    """
+    def __init__(self, guides: Sequence[Face3D], tolerance: float, angle_tolerance: float):
+        self.guides = list(guides)
+        self.tolerance = tolerance
+        self.angle_tolerance = angle_tolerance
+        self._grid = BoxGrid([face_box(g, tolerance) for g in self.guides]) if self.guides else None
+
+    def faces_by_guide_surface(self, room: Room) -> list:
+        """Faces of the room touching and coplanar with a guide, same result as Room.faces_by_guide_surface
+
+        Args:
+            room (Room): Room to select faces of
+
+        Returns:
+            list: Selected honeybee Faces in room order
+        """
+        if self._grid is None:
+            return []
+        tol, ang_tol = self.tolerance, self.angle_tolerance
+        selected = []
+        for face in room.faces:
+            geo = face.geometry
+            for i in self._grid.query(face_box(geo)):
+                guide = self.guides[i]
+                if maybe_coplanar(geo, guide, tol, ang_tol) and geo.plane.is_coplanar_tolerance(guide.plane, tol, ang_tol):
+                    if guide.is_point_on_face(geo._point_on_face(tol * 2), tol):
+                        selected.append(face)
+                        break
+        return selected
+
+
+Frame = Tuple[Point3D, Vector3D, Vector3D]
+
+
+def wall_frame(face: Face3D, tolerance: float) -> Optional[Frame]:
+    """Local frame of a non-horizontal face, at its first vertex with the y axis along the horizontal part of its normal
+
+    Faces which are copies of each other moved and rotated about the z axis have the
+    same vertices in their frames.
+
+    Args:
+        face (Face3D): Face to get the frame of
+        tolerance (float): Faces with a horizontal normal component below twice this get no frame
+
+    Returns:
+        Optional[Frame]: (origin, x axis, y axis), the z axis is world z, or None for horizontal faces
+    """
+    n = face.normal
+    h = math.hypot(n.x, n.y)
+    if h <= 2 * tolerance:
+        return None
+    y = Vector3D(n.x / h, n.y / h, 0)
+    return face.vertices[0], Vector3D(-y.y, y.x, 0), y
+
+
+def to_frame(point: Point3D, frame: Frame, is_vector: bool = False) -> Tuple[float, float, float]:
+    o, x, y = frame
+    dx, dy, dz = (point.x, point.y, point.z) if is_vector else (point.x - o.x, point.y - o.y, point.z - o.z)
+    return dx * x.x + dy * x.y, dx * y.x + dy * y.y, dz
+
+
+def from_frame(coords: Sequence[float], frame: Frame, is_vector: bool = False) -> Tuple[float, float, float]:
+    o, x, y = frame
+    u, v, w = coords
+    px, py, pz = u * x.x + v * y.x, u * x.y + v * y.y, w
+    return (px, py, pz) if is_vector else (o.x + px, o.y + py, o.z + pz)
+
+
+def face_to_frame(face: Face3D, frame: Frame) -> tuple:
+    """Boundary, holes and plane of a face in frame coordinates, see face_from_frame"""
+    pl = face.plane
+    holes = [[to_frame(p, frame) for p in hole] for hole in face.holes] if face.has_holes else None
+    return ([to_frame(p, frame) for p in face.boundary], holes,
+        to_frame(pl.o, frame), to_frame(pl.n, frame, True), to_frame(pl.x, frame, True))
+
+
+def face_from_frame(local: tuple, frame: Frame) -> Face3D:
+    """Face3D with the same plane axes from the output of face_to_frame"""
+    boundary, holes, o, n, x = local
+    def pts(coords):
+        return [Point3D(*from_frame(c, frame)) for c in coords]
+    plane = Plane(Vector3D(*from_frame(n, frame, True)), Point3D(*from_frame(o, frame)), Vector3D(*from_frame(x, frame, True)))
+    return Face3D(pts(boundary), plane, [pts(hole) for hole in holes] if holes else None)
+
+
+def overlapping_pairs(boxes: Sequence[Box], pad: float = 0) -> List[Tuple[int, int]]:
+    """Pairs of overlapping boxes found with a sweep along x
+
+    Boxes far apart along x are never compared.
+
+    Args:
+        boxes (Sequence[Box]): Boxes to test
+        pad (float): Gap below which two boxes count as overlapping
+
+    Returns:
+        List[Tuple[int, int]]: Sorted (i, j) index pairs with i < j
+    """
+    pairs = []
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][0][0])
+    active: List[int] = []
+    for i in order:
+        min_x = boxes[i][0][0]
+        active = [j for j in active if boxes[j][1][0] + pad >= min_x]
+        for j in active:
+            if boxes_overlap(boxes[i], boxes[j], pad):
+                pairs.append((min(i, j), max(i, j)))
+        active.append(i)
+    return sorted(pairs)
+
+
+def overlap_components(boxes: Sequence[Box], pad: float = 0) -> List[List[int]]:
+    """Groups boxes into connected components of the box overlap graph
+
+    Args:
+        boxes (Sequence[Box]): Boxes to group
+        pad (float): Gap below which two boxes count as overlapping
+
+    Returns:
+        List[List[int]]: Components as ascending lists of box indices, ordered by their first index
+    """
+    parent = list(range(len(boxes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in overlapping_pairs(boxes, pad):
+        parent[find(i)] = find(j)
+
+    components: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(boxes)):
+        components[find(i)].append(i)
+    return sorted(components.values(), key=lambda c: c[0])
+
+
+def polyface_box(polyface: Polyface3D, pad: float = 0) -> Box:
+    mn, mx = polyface.min, polyface.max
+    return (mn.x - pad, mn.y - pad, mn.z - pad), (mx.x + pad, mx.y + pad, mx.z + pad)
+
+
+class CenterHash():
+    """Hash of face centers on a grid of cell size tolerance
+
+    Args:
+        faces (Sequence[Face3D]): Faces to index, queries return their indices
+        tolerance (float): Distance within which two centers are considered equal
+    """
+    def __init__(self, faces: Sequence[Face3D], tolerance: float):
+        self.cell_size = tolerance if tolerance > 0 else 1e-9
+        self._cells: Dict[Tuple[int, int, int], List[int]] = defaultdict(list)
+        for i, face in enumerate(faces):
+            self._cells[self._cell(face.center)].append(i)
+
+    def _cell(self, pt) -> Tuple[int, int, int]:
+        return (math.floor(pt.x / self.cell_size), math.floor(pt.y / self.cell_size),
+            math.floor(pt.z / self.cell_size))
+
+    def query(self, pt) -> List[int]:
+        """Indices of faces with a center within one cell of pt, in ascending order"""
+        x, y, z = self._cell(pt)
+        found = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    found.extend(self._cells.get((x + dx, y + dy, z + dz), ()))
+        return sorted(found)
+
+
+def solve_adjacency(rooms: Sequence[Room], tolerance: float) -> Dict[str, list]:
+    """Solves adjacency between rooms like Room.solve_adjacency, but with broad phases
+
+    Candidate room pairs come from a sweep over room bounding boxes inflated by
+    the tolerance, and candidate face pairs from a hash of face centers (centered
+    adjacent faces share their center within tolerance). Pairs are visited in the
+    same order as Room.solve_adjacency, so the same faces end up adjacent.
+
+    Args:
+        rooms (Sequence[Room]): Rooms to solve adjacency for, they are mutated
+        tolerance (float): Model tolerance
+
+    Returns:
+        Dict[str, list]: Same adjacency information as Room.solve_adjacency
+    """
+    adj_info = {'adjacent_faces': [], 'adjacent_apertures': [], 'adjacent_doors': []}
+    boxes = [polyface_box(room.geometry) for room in rooms]
+    center_hashes: Dict[int, CenterHash] = {}
+    for i, j in overlapping_pairs(boxes, 2 * tolerance):
+        room_1, room_2 = rooms[i], rooms[j]
+        if not Polyface3D.overlapping_bounding_boxes(room_1.geometry, room_2.geometry, tolerance):
+            continue
+        if j not in center_hashes:
+            center_hashes[j] = CenterHash([f.geometry for f in room_2.faces], tolerance)
+        faces_2 = room_2.faces
+        for face_1 in room_1.faces:
+            for k in center_hashes[j].query(face_1.geometry.center):
+                face_2 = faces_2[k]
+                if not isinstance(face_2.boundary_condition, Surface):
+                    if face_1.geometry.is_centered_adjacent(face_2.geometry, tolerance):
+                        face_info = face_1.set_adjacency(face_2)
+                        adj_info['adjacent_faces'].append((face_1, face_2))
+                        adj_info['adjacent_apertures'].extend(face_info['adjacent_apertures'])
+                        adj_info['adjacent_doors'].extend(face_info['adjacent_doors'])
+                        break
+    return adj_info
+
+
+def mesh_arrays_to_face3ds(vertices: "np.ndarray", faces: "np.ndarray", tolerance: float) -> List[Face3D]:
+    """Face3Ds from mesh vertex and face index arrays, matching the per-face loop of to_face3d_patched
+
+    Args:
+        vertices (np.ndarray): (n, 3) array of vertex coordinates
+        faces (np.ndarray): (m, 4) array of vertex indices, triangles repeat their third index
+        tolerance (float): Distance from the plane above which a quad is split into triangles
+
+    Returns:
+        List[Face3D]: Face3Ds for the faces with a non-zero area
+    """
+    return list(FaceArrays.from_mesh_arrays(vertices, faces, tolerance))
+
+
+class FaceArrays():
+    """Triangles and quads kept as index arrays into a shared vertex pool
+
+    A compact stand-in for a list of Face3Ds from a mesh: a Face3D takes a few hundred
+    bytes plus its Point3Ds, a face here takes 32 bytes and its vertices are shared.
+    Face3Ds are only made when the faces are indexed or iterated, with the same vertices
+    (and so the same plane) as to_face3d_patched gives.
+
+    Args:
+        vertices (np.ndarray): (n, 3) array of vertex coordinates
+        faces (np.ndarray): (m, 4) array of vertex indices, -1 as fourth index for triangles
+    """
+    def __init__(self, vertices: "np.ndarray", faces: "np.ndarray"):
+        self.vertices = vertices
+        self.faces = faces
+
+    @classmethod
+    def from_mesh_arrays(cls, vertices: "np.ndarray", faces: "np.ndarray", tolerance: float) -> "FaceArrays":
+        """Faces of a mesh with the same rules as the per-face loop of to_face3d_patched
+
+        Zero area faces are dropped and non-planar quads are split into two triangles.
+        Areas and planarity are computed for all faces at once, faces too close to call
+        in floating point get the same Face3D checks as the loop. Duplicate vertices are
+        pooled.
+
+        Args:
+            vertices (np.ndarray): (n, 3) array of vertex coordinates
+            faces (np.ndarray): (m, 4) array of vertex indices, triangles repeat their third index
+            tolerance (float): Distance from the plane above which a quad is split into triangles
+
+        Returns:
+            FaceArrays: The faces with a non-zero area
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        faces = np.array(faces, dtype=np.int64).reshape(-1, 4)  # a copy, it is modified
+        is_quad = faces[:, 2] != faces[:, 3]  # before pooling, which may merge the indices of a quad
+        vertices, faces = _pool_vertices(vertices, faces)
+        if len(faces) == 0:
+            return cls(vertices, faces)
+        p0, p1, p2, p3 = (vertices[faces[:, k]] for k in range(4))
+
+        # same normal as Face3D._plane_from_vertices: sum of the fan cross products
+        normal = np.cross(p1 - p0, p2 - p0)
+        normal[is_quad] += np.cross(p2 - p0, p3 - p0)[is_quad]
+        normal_len = np.sqrt((normal ** 2).sum(axis=1))
+        edge_sq = np.maximum.reduce([((b - a) ** 2).sum(axis=1) for a, b in ((p0, p1), (p1, p2), (p2, p3), (p3, p0))])
+        area_sure = normal_len > 1e-9 * edge_sq  # twice the area, clearly non-zero
+
+        # largest distance of a vertex to the plane through p0
+        unit = normal / np.where(normal_len > 0, normal_len, 1)[:, None]
+        dist = np.max([np.abs(((p - p0) * unit).sum(axis=1)) for p in (p1, p2, p3)], axis=0)
+        band = tolerance * 1e-6 + 1e-9 * max(1.0, float(np.abs(vertices).max()))
+        keep = area_sure & (~is_quad | (dist < tolerance - band) | (dist >= tolerance + band))
+        split = keep & is_quad & (dist >= tolerance + band)
+
+        # too close to call, use the same checks as the per-face loop
+        faces[~is_quad, 3] = -1
+        for f in np.flatnonzero(~keep).tolist():
+            lb_face = cls(vertices, faces[f:f + 1])[0]
+            if lb_face.area == 0:
+                continue
+            keep[f] = True
+            split[f] = is_quad[f] and any(lb_face.plane.distance_to_point(_v) >= tolerance for _v in lb_face.vertices)
+
+        rows = keep.astype(np.int64) + split
+        start = np.cumsum(rows) - rows
+        first = faces.copy()
+        first[split, 3] = -1
+        second = faces[split][:, [3, 0, 1, 1]]
+        second[:, 3] = -1
+        out = np.empty((int(rows.sum()), 4), dtype=np.int64)
+        out[start[keep]] = first[keep]
+        out[start[split] + 1] = second
+        return cls(vertices, out)
+
+    def __len__(self) -> int:
+        return len(self.faces)
+
+    def __getitem__(self, i: int) -> Face3D:
+        a, b, c, d = self.faces[i].tolist()
+        return Face3D(tuple(Point3D(*self.vertices[k].tolist()) for k in ((a, b, c) if d < 0 else (a, b, c, d))))
+
+    def __iter__(self) -> Iterable[Face3D]:
+        coords = self.vertices.tolist()
+        pts: Dict[int, Point3D] = {}
+        def pt(i):
+            if i not in pts:
+                pts[i] = Point3D(*coords[i])
+            return pts[i]
+        for a, b, c, d in self.faces.tolist():
+            yield Face3D((pt(a), pt(b), pt(c)) if d < 0 else (pt(a), pt(b), pt(c), pt(d)))
+
+    @property
+    def nbytes(self) -> int:
+        return self.vertices.nbytes + self.faces.nbytes
+
+    def select(self, mask: "np.ndarray") -> "FaceArrays":
+        """Faces where mask is True, sharing the vertex pool"""
+        return FaceArrays(self.vertices, self.faces[mask])
+
+    def away_from_box(self, box: Box) -> "np.ndarray":
+        """faces_away_from_box for all faces at once
+
+        Returns:
+            np.ndarray: True for the faces with every corner of box behind their plane
+        """
+        faces = self.faces
+        is_quad = faces[:, 3] >= 0
+        p0, p1, p2 = (self.vertices[faces[:, k]] for k in range(3))
+        p3 = self.vertices[np.where(is_quad, faces[:, 3], faces[:, 2])]
+        normal = np.cross(p1 - p0, p2 - p0)
+        normal[is_quad] += np.cross(p2 - p0, p3 - p0)[is_quad]
+        corners = np.array([(x, y, z) for x in (box[0][0], box[1][0]) for y in (box[0][1], box[1][1])
+            for z in (box[0][2], box[1][2])])
+        # Face3D reverses clockwise vertices, so its first vertex is p0 or the last one
+        band = 1e-9 * np.sqrt((normal ** 2).sum(axis=1)) * max(1.0, float(np.abs(corners).max()),
+            float(np.abs(self.vertices).max()) if len(self.vertices) else 1.0)
+        away, near = np.ones(len(faces), dtype=bool), np.zeros(len(faces), dtype=bool)
+        for origin in (p0, np.where(is_quad[:, None], p3, p2)):
+            dist = (corners[None, :, :] - origin[:, None, :]) @ normal[:, :, None]
+            dist = dist[:, :, 0].max(axis=1)
+            away &= dist < 0
+            near |= np.abs(dist) <= band
+        for f in np.flatnonzero(near).tolist():
+            away[f] = faces_away_from_box(self[f], box)
+        return away
+
+    def to_mesh3d(self) -> Mesh3D:
+        """Same Mesh3D as face3ds_to_mesh3d(list(self)), without making the Face3Ds"""
+        faces = self.faces
+        # vertex ids in order of first use, as face3ds_to_mesh3d numbers them
+        order = faces.ravel()
+        order = order[order >= 0]
+        unique, first = np.unique(order, return_index=True)
+        pool = unique[np.argsort(first)]
+        new_id = np.full(len(self.vertices) + 1, -1, dtype=np.int64)  # -1 stays -1
+        new_id[pool] = np.arange(len(pool))
+        vertices = tuple(Point3D(*xyz) for xyz in self.vertices[pool].tolist())
+        mesh_faces = [tuple(row[:3]) if row[3] < 0 else tuple(row) for row in new_id[faces].tolist()]
+        return Mesh3D(vertices, mesh_faces)
+
+
+def _pool_vertices(vertices: "np.ndarray", faces: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """Merges vertices with the same coordinates, keeping the first of each
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Pooled vertices and the faces indexing them
+    """
+    if len(vertices) < 2:
+        return vertices, faces
+    order = np.lexsort(vertices.T[::-1])
+    ordered = vertices[order]
+    new_group = np.empty(len(order), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = np.any(ordered[1:] != ordered[:-1], axis=1)
+    if new_group.all():
+        return vertices, faces
+    group = np.cumsum(new_group) - 1
+    keep = np.sort(order[new_group])  # lexsort is stable, so these are the first of each group
+    remap = np.empty(len(vertices), dtype=np.int64)
+    remap[order] = np.searchsorted(keep, order[new_group][group])
+    return vertices[keep], remap[faces]
+
+
+def face3ds_to_mesh3d(faces: Sequence[Face3D]) -> Mesh3D:
+    """Joins Face3Ds into one Mesh3D with a shared vertex pool
+
+    Triangles and quads without holes are kept as mesh faces, other faces are triangulated.
+
+    Args:
+        faces (Sequence[Face3D]): Faces to join
+
+    Returns:
+        Mesh3D: Mesh with one or more mesh faces per input face
+    """
+    vertices: List[Point3D] = []
+    index: Dict[Tuple[float, float, float], int] = {}
+    mesh_faces = []
+
+    def vertex_id(pt):
+        key = (pt.x, pt.y, pt.z)
+        if key not in index:
+            index[key] = len(vertices)
+            vertices.append(pt)
+        return index[key]
+
+    for face in faces:
+        if not face.has_holes and len(face.vertices) in (3, 4):
+            mesh_faces.append(tuple(vertex_id(pt) for pt in face.vertices))
+        else:
+            tri_mesh = face.triangulated_mesh3d
+            for tri in tri_mesh.faces:
+                mesh_faces.append(tuple(vertex_id(tri_mesh.vertices[i]) for i in tri))
+    return Mesh3D(vertices, mesh_faces)
+
+
+def merge_coplanar_faces(faces: Sequence[Face3D], tolerance: float, angle_tolerance: float) -> List[Face3D]:
+    """Joins neighbouring coplanar Face3Ds along shared edges
+
+    Faces are bucketed by their plane normal (to angle_tolerance) and offset
+    (to tolerance) and each bucket is joined with Face3D.join_coplanar_faces.
+    Larger tolerances merge more faces into fewer, less accurate ones.
+
+    Args:
+        faces (Sequence[Face3D]): Faces to merge
+        tolerance (float): Plane offset difference within which faces count as coplanar
+        angle_tolerance (float): Normal difference in radians within which faces count as coplanar
+
+    Returns:
+        List[Face3D]: Merged faces
+    """
+    buckets: Dict[Tuple[int, int, int, int], List[Face3D]] = {}
+    for face in faces:
+        n = face.normal
+        offset = n.dot(face.vertices[0] - Point3D())
+        key = (round(n.x / angle_tolerance), round(n.y / angle_tolerance),
+            round(n.z / angle_tolerance), round(offset / tolerance))
+        buckets.setdefault(key, []).append(face)
+
+    merged = []
+    for bucket in buckets.values():
+        if len(bucket) == 1:
+            merged.extend(bucket)
+            continue
+        try:
+            merged.extend(Face3D.join_coplanar_faces(bucket, tolerance))
+        except Exception:  # joining failed, keep the faces as they are
+            merged.extend(bucket)
+    return merged
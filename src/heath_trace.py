@@ -0,0 +1,222 @@
+# Copyright (c) 2024, Heath.
+# You should have received a copy of the GNU Affero General Public License
+# along with Heath; If not, see <http://www.gnu.org/licenses/>.
+#
+# @license AGPL-3.0-or-later <https://spdx.org/licenses/AGPL-3.0-or-later>
+
+
+""" Nested timing spans with counters, exported as JSON or Chrome trace files, and build progress hooks"""
+
+from contextlib import contextmanager
+import json
+import math
+import os
+import threading
+from time import perf_counter
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_active = threading.local()
+
+
+class BuildCancelled(Exception):
+    """Raised from heath_trace.progress() when the build of the active trace was cancelled"""
+
+
+class Span():
+    """A timed section of a build
+
+    Args:
+        name (str): Name of the span, top level span names are used as report lines
+        start (float): Start time in seconds relative to the start of the trace
+    """
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.duration = 0.0
+        self.counters: Dict[str, Any] = {}
+        self.peak_memory: Optional[int] = None
+        self.children: List["Span"] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "counters": self.counters,
+            "peak_memory": self.peak_memory,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Trace():
+    """Records nested spans of a build.
+
+    Spans are opened with heath_trace.span() while the trace is active, so
+    instrumented functions don't need a trace argument.
+
+    Stages also report progress with heath_trace.progress(), which is forwarded to
+    on_progress and stops the build by raising BuildCancelled once cancel_event is set.
+
+    Args:
+        memory (bool): Record peak traced memory per span with tracemalloc
+        on_progress (Optional[Callable[[str, int, int], None]]): Called with (stage, done, total)
+        cancel_event (Optional[threading.Event]): Event which cancels the build when set
+        progress_interval (float): Minimum seconds between on_progress calls within a stage
+    """
+    def __init__(
+            self,
+            memory: bool = False,
+            on_progress: Optional[Callable[[str, int, int], None]] = None,
+            cancel_event: Optional[threading.Event] = None,
+            progress_interval: float = 0.1,
+        ):
+        self.memory = memory
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+        self.progress_interval = progress_interval
+        self.spans: List[Span] = []
+        self.notes: List[tuple[float, str]] = []
+        self._t0 = perf_counter()
+        self._stack: List[Span] = []
+        self._last_progress = -math.inf
+
+    @contextmanager
+    def activate(self) -> Iterator["Trace"]:
+        """Makes this the trace spans are recorded in for the current thread"""
+        previous = getattr(_active, "trace", None)
+        _active.trace = self
+        started_memory = self.memory and not tracemalloc.is_tracing()
+        if started_memory:
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            if started_memory:
+                tracemalloc.stop()
+            _active.trace = previous
+
+    @contextmanager
+    def span(self, name: str, **counters: Any) -> Iterator[Span]:
+        sp = Span(name, perf_counter() - self._t0)
+        sp.counters.update(counters)
+        parent = self._stack[-1] if self._stack else None
+        (parent.children if parent else self.spans).append(sp)
+        if self.memory and tracemalloc.is_tracing():
+            if parent is not None:
+                parent.peak_memory = max(parent.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append(sp)
+        try:
+            yield sp
+        finally:
+            self._stack.pop()
+            sp.duration = perf_counter() - self._t0 - sp.start
+            if self.memory and tracemalloc.is_tracing():
+                sp.peak_memory = max(sp.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+                if parent is not None:
+                    parent.peak_memory = max(parent.peak_memory or 0, sp.peak_memory)
+
+    def count(self, **counters: Any) -> None:
+        """Sets counters on the innermost open span"""
+        if self._stack:
+            self._stack[-1].counters.update(counters)
+
+    def progress(self, stage: str, done: int, total: int) -> None:
+        """Reports that done of total items of a stage are finished
+
+        Raises:
+            BuildCancelled: The cancel event is set
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise BuildCancelled(stage)
+        if self.on_progress is None:
+            return
+        now = perf_counter()
+        if done == 0 or done >= total or now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.on_progress(stage, done, total)
+
+    def note(self, message: str) -> None:
+        """Adds a line to the report"""
+        self.notes.append((perf_counter() - self._t0, message))
+
+    def report(self) -> List[str]:
+        """Report lines for the top level spans and notes, in order
+
+        Returns:
+            List[str]: Lines like "Created HB rooms in 3.2 s"
+        """
+        lines = [(sp.start + sp.duration, f"{sp.name} in {sp.duration} s" + (" (cached)" if sp.counters.get("cached") else ""))
+            for sp in self.spans]
+        lines.extend(self.notes)
+        return [line for _, line in sorted(lines, key=lambda line: line[0])]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "spans": [sp.to_dict() for sp in self.spans],
+            "notes": [message for _, message in self.notes],
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Trace in the Chrome trace event format (chrome://tracing, Perfetto)"""
+        events = []
+        def add(sp: Span):
+            args = dict(sp.counters)
+            if sp.peak_memory is not None:
+                args["peak_memory"] = sp.peak_memory
+            events.append({"name": sp.name, "ph": "X", "ts": sp.start * 1e6, "dur": sp.duration * 1e6,
+                "pid": 0, "tid": 0, "args": args})
+            for child in sp.children:
+                add(child)
+        for sp in self.spans:
+            add(sp)
+        for time, message in self.notes:
+            events.append({"name": message, "ph": "i", "ts": time * 1e6, "pid": 0, "tid": 0, "s": "g"})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, folder: str, name: str = "heath_trace") -> List[str]:
+        """Writes the trace as JSON and as a Chrome trace, e.g. into get_results_folder()
+
+        Args:
+            folder (str): Folder to write to
+            name (str): File name prefix
+
+        Returns:
+            List[str]: Paths of the written files
+        """
+        paths = [os.path.join(folder, f"{name}.json"), os.path.join(folder, f"{name}.chrome.json")]
+        for path, data in zip(paths, (self.to_dict(), self.to_chrome_trace())):
+            with open(path, "w") as f:
+                json.dump(data, f, indent=1)
+        return paths
+
+
+@contextmanager
+def span(name: str, **counters: Any) -> Iterator[Optional[Span]]:
+    """Opens a span in the active trace, does nothing if no trace is active"""
+    trace: Optional[Trace] = getattr(_active, "trace", None)
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **counters) as sp:
+        yield sp
+
+
+def count(**counters: Any) -> None:
+    """Sets counters on the innermost open span of the active trace"""
+    trace: Optional[Trace] = getattr(_active, "trace", None)
+    if trace is not None:
+        trace.count(**counters)
+
+
+def progress(stage: str, done: int, total: int) -> None:
+    """Reports stage progress to the active trace, does nothing if no trace is active
+
+    Raises:
+        BuildCancelled: The build of the active trace was cancelled
+    """
+    trace: Optional[Trace] = getattr(_active, "trace", None)
+    if trace is not None:
+        trace.progress(stage, done, total)
@@ -4,10 +4,37 @@ from System.Windows.Controls import TextBlock # type: ignore
 from System.Windows import WindowState # type: ignore
 import scriptcontext as sc
 from Rhino.Geometry import Point3d # type: ignore
+from System import Action # type: ignore
 
 def handle_close_window():
     sc.sticky["heath_main_window"].pop("heath_main_window", None)
 
+def build_status(stage: str, done: int, total: int) -> str:
+    return f"Building model: {stage} {done}/{total}" if total else f"Building model: {stage}"
+
+def show_build_progress(job):
+    """Shows the progress of a background build (heath.start_build) in the main window
+
+    Args:
+        job (heath.BuildJob): Running build
+    """
+    win = sc.sticky.get("heath_main_window")
+    if win is None:
+        return
+    tb = sc.sticky.get("heath_build_status")
+    if tb is None:
+        tb = TextBlock()
+        tb.Height = 20
+        win.AddElement(tb)
+        sc.sticky["heath_build_status"] = tb
+
+    def update(stage, done, total):
+        if sc.sticky.get("heath_build_job") is not job: # a newer build took over the status line
+            return
+        text = build_status(stage, done, total)
+        win.Dispatcher.BeginInvoke(Action(lambda: setattr(tb, "Text", text)))
+    job.add_listener(update)
+
 def heath_main_window(title: str, width: float, height: float, accent_color: str, location: Point3d, show: bool):
     if not show:
         pass
@@ -8,18 +8,83 @@
 """ This file contains patched Honeybee functions which do not work in Python 3"""
 """ Changed lines from ladybug_rhino.togeometry have a "patched" comment"""
 
+import functools
+import hashlib
 from typing import List
-import Rhino.Geometry as rg # type: ignore
 from ladybug_geometry.geometry3d.polyface import Polyface3D
 from ladybug_geometry.geometry3d.face import Face3D
-from ladybug_rhino.togeometry import to_point3d, _remove_dup_verts, from_face3ds_to_joined_brep, to_plane
-import ladybug_rhino.planarize as _planar
+from ladybug_geometry.geometry3d.mesh import Mesh3D
 from ladybug_rhino.config import tolerance
+try:
+    import Rhino.Geometry as rg # type: ignore
+    import scriptcontext as sc
+    from ladybug_rhino.togeometry import to_point3d, _remove_dup_verts, from_face3ds_to_joined_brep, to_plane
+    import ladybug_rhino.planarize as _planar
+    sticky = sc.sticky
+except ImportError:  # headless, only ladybug_geometry input is supported
+    rg = None
+    sticky = {}
+from heath_cache import LRUCache, content_hash
+from heath_geometry import np, FaceArrays, mesh_arrays_to_face3ds
 
 import sys
 if (sys.version_info > (3, 0)):  # python 3
     xrange = range
 
+conversion_cache_size = 4096 # converted Rhino objects kept across recomputes
+
+def get_conversion_cache():
+    """Cache of Rhino to ladybug conversions, kept in sc.sticky to survive recomputes and reloads
+
+    Returns:
+        LRUCache: Converted geometry keyed on geometry and meshing parameter hashes
+    """
+    cache = sticky.get("heath_conversion_cache")
+    if cache is None or cache.max_size != conversion_cache_size:
+        cache = LRUCache(conversion_cache_size)
+        sticky["heath_conversion_cache"] = cache
+    return cache
+
+
+def _cached_conversion(convert):
+    """Memoizes a conversion of Rhino geometry, ladybug geometry is passed on uncached"""
+    @functools.wraps(convert)
+    def wrapper(geo, meshing_parameters=None):
+        if rg is None or not isinstance(geo, rg.GeometryBase):
+            return convert(geo, meshing_parameters)
+        key = (convert.__name__, geometry_hash(geo), _meshing_hash(meshing_parameters), tolerance)
+        value, _ = get_conversion_cache().get_or_build(key, lambda: convert(geo, meshing_parameters))
+        return list(value) if isinstance(value, list) else value  # callers may extend the list
+    return wrapper
+
+
+def geometry_hash(geo):
+    """Hash of Rhino or ladybug geometry, used for the conversion and stage cache keys
+
+    Args:
+        geo: A Rhino Brep, Surface or Mesh or ladybug geometry
+
+    Returns:
+        str: Hex digest which only changes when the geometry changes
+    """
+    if rg is not None and isinstance(geo, rg.Mesh) and np is not None:  # hashing the arrays is much faster than ToJSON
+        h = hashlib.sha1(b"mesh")
+        for array in mesh_arrays(geo):
+            h.update(array.tobytes())
+        return h.hexdigest()
+    return content_hash(geo)
+
+
+def _meshing_hash(meshing_parameters):
+    if meshing_parameters is None:
+        return None
+    fields = ("GridAngle", "GridAspectRatio", "GridMaxCount", "GridMinCount", "MaximumEdgeLength",
+        "MinimumEdgeLength", "MinimumTolerance", "RefineAngle", "RefineGrid", "RelativeTolerance",
+        "SimplePlanes", "Tolerance", "JaggedSeams", "ClosedObjectPostProcess")
+    return content_hash([getattr(meshing_parameters, f, None) for f in fields])
+
+
+@_cached_conversion
 def to_polyface3d_patched(geo, meshing_parameters=None):
     """A Ladybug Polyface3D object from a Rhino Brep.
 
@@ -30,6 +95,10 @@ def to_polyface3d_patched(geo, meshing_parameters=None):
             curved faces should be converted into planar elements. If None,
             Rhino's Default Meshing Parameters will be used.
     """
+    if isinstance(geo, Polyface3D):  # already ladybug geometry
+        return geo
+    if isinstance(geo, (Face3D, Mesh3D)):
+        return Polyface3D.from_faces(to_face3d_patched(geo), tolerance)
     mesh_par = meshing_parameters or rg.MeshingParameters.Default  # default
     if not isinstance(geo, rg.Mesh):
         if not isinstance(geo, rg.Brep):  # it's likely an extrusion object
@@ -42,6 +111,7 @@ def to_polyface3d_patched(geo, meshing_parameters=None):
     return Polyface3D.from_faces(to_face3d_patched(geo, mesh_par), tolerance)
 
 
+@_cached_conversion
 def to_face3d_patched(geo, meshing_parameters=None) -> List[Face3D]:
     """List of Ladybug Face3D objects from a Rhino Brep, Surface or Mesh.
 
@@ -53,7 +123,15 @@ def to_face3d_patched(geo, meshing_parameters=None) -> List[Face3D]:
             Rhino's Default Meshing Parameters will be used.
     """
     faces = []  # list of Face3Ds to be populated and returned
-    if isinstance(geo, rg.Mesh):  # convert each Mesh face to a Face3D
+    if isinstance(geo, Face3D):  # already ladybug geometry
+        return [geo]
+    elif isinstance(geo, Polyface3D):
+        return list(geo.faces)
+    elif isinstance(geo, Mesh3D):
+        return mesh3d_to_face3ds(geo)
+    elif isinstance(geo, rg.Mesh) and np is not None:  # convert all Mesh faces at once
+        return mesh_arrays_to_face3ds(*mesh_arrays(geo), tolerance)
+    elif isinstance(geo, rg.Mesh):  # convert each Mesh face to a Face3D
         pts = tuple(to_point3d(pt) for pt in geo.Vertices)
         for face in geo.Faces:
             if face.IsQuad:
@@ -108,6 +186,72 @@ def to_face3d_patched(geo, meshing_parameters=None) -> List[Face3D]:
     return faces
 
 
+@_cached_conversion
+def to_face_arrays_patched(geo, meshing_parameters=None):
+    """Faces of geometry like to_face3d_patched, as FaceArrays for meshes when numpy is available
+
+    Meshes, which make up most large context geometry, are kept as arrays over a shared
+    vertex pool instead of Face3Ds. Other geometry gives the list of to_face3d_patched.
+
+    Args:
+        geo: A Rhino Brep, Surface, Extrusion or Mesh, or ladybug geometry.
+        meshing_parameters: Optional Rhino Meshing Parameters, see to_face3d_patched.
+
+    Returns:
+        FaceArrays or a list of Face3D.
+    """
+    if np is not None and isinstance(geo, Mesh3D):
+        return FaceArrays.from_mesh_arrays(*mesh3d_arrays(geo), tolerance)
+    if np is not None and rg is not None and isinstance(geo, rg.Mesh):
+        return FaceArrays.from_mesh_arrays(*mesh_arrays(geo), tolerance)
+    return to_face3d_patched(geo, meshing_parameters)
+
+
+def mesh3d_to_face3ds(mesh):
+    """List of Ladybug Face3D objects from a Ladybug Mesh3D, same rules as for Rhino meshes."""
+    if np is not None:
+        return mesh_arrays_to_face3ds(*mesh3d_arrays(mesh), tolerance)
+    faces = [tuple(f) + (f[-1],) if len(f) == 3 else tuple(f) for f in mesh.faces]
+    pts, lb_faces = mesh.vertices, []
+    for face in faces:
+        if face[2] == face[3]:  # triangle
+            lb_face = Face3D((pts[face[0]], pts[face[1]], pts[face[2]]))
+            if lb_face.area != 0:
+                lb_faces.append(lb_face)
+            continue
+        lb_face = Face3D(tuple(pts[i] for i in face))
+        if lb_face.area != 0:
+            if any(lb_face.plane.distance_to_point(_v) >= tolerance for _v in lb_face.vertices):
+                lb_faces.append(Face3D((pts[face[0]], pts[face[1]], pts[face[2]])))
+                lb_faces.append(Face3D((pts[face[3]], pts[face[0]], pts[face[1]])))
+            else:
+                lb_faces.append(lb_face)
+    return lb_faces
+
+
+def mesh3d_arrays(mesh):
+    """Vertex and face index arrays of a Ladybug Mesh3D, triangles repeat their third vertex index."""
+    faces = [tuple(f) + (f[-1],) if len(f) == 3 else tuple(f) for f in mesh.faces]
+    return np.array([v.to_array() for v in mesh.vertices], dtype=np.float64).reshape(-1, 3), \
+        np.array(faces, dtype=np.int64).reshape(-1, 4)
+
+
+def mesh_arrays(mesh):
+    """Vertex and face index arrays of a Rhino Mesh.
+
+    Vertices are read as single precision floats, the same values iterating
+    over mesh.Vertices gives. Triangles repeat their third vertex index.
+
+    Returns:
+        A tuple with a (n, 3) float array and a (m, 4) int array.
+    """
+    vertices = np.fromiter(mesh.Vertices.ToFloatArray(), dtype=np.float32,
+                           count=mesh.Vertices.Count * 3).reshape(-1, 3)
+    faces = np.fromiter(mesh.Faces.ToIntArray(False), dtype=np.int64,
+                        count=mesh.Faces.Count * 4).reshape(-1, 4)
+    return vertices.astype(np.float64), faces
+
+
 def planar_face_curved_edge_vertices_patched(b_face, count, meshing_parameters):
     """Extract vertices from a planar brep face loop that has one or more curved edges.
 
@@ -0,0 +1,121 @@
+"""create_hb_model stage and model caches"""
+
+from contextlib import redirect_stdout
+import io
+
+from ladybug_geometry.geometry3d.plane import Plane
+from ladybug_geometry.geometry3d.pointvector import Point3D
+from ladybug_geometry.geometry3d.polyface import Polyface3D
+
+import bench_heath
+import heath
+import heath_deps
+
+heath.load_dependencies()
+
+WINDOWS = heath.WindowSettings(0.4, 2.0, 0.8, 3.0, 0.2)
+NOT_CLOSED = "Input _geo is not a closed volume."
+
+
+def open_box(x):
+    """A box without its roof"""
+    box = Polyface3D.from_box(4.0, 6.0, 3.0, Plane(o=Point3D(x, 0, 0)))
+    return Polyface3D(box.vertices, box.face_indices[:-1])
+
+
+def build(room_geo, **kwargs):
+    log = io.StringIO()
+    with redirect_stdout(log):
+        model, _ = heath.create_hb_model(None, room_geo, [], [], [], [], [], WINDOWS, None, [], "m", **kwargs)
+    return model, log.getvalue()
+
+
+def test_stage_cache_hit_repeats_warnings():
+    room_geo = [open_box(100)]
+    _, log = build(room_geo)
+    assert NOT_CLOSED in log
+    _, log = build(room_geo)
+    assert NOT_CLOSED in log
+
+
+def test_model_cache_hit_repeats_warnings(tmp_path):
+    room_geo = [open_box(200)]
+    model, log = build(room_geo, use_cache=False, model_cache_folder=str(tmp_path))
+    assert NOT_CLOSED in log
+    heath.flush_model_cache()
+    cached, log = build(room_geo, use_cache=False, model_cache_folder=str(tmp_path))
+    assert NOT_CLOSED in log
+    assert cached.to_dict() == model.to_dict()
+
+
+def rooms_cached(room_geo):
+    trace = heath.Trace()
+    with redirect_stdout(io.StringIO()):
+        heath.create_hb_model(None, room_geo, [], [], [], [], [], WINDOWS, None, [], "m", trace=trace)
+    span, = [span for span in trace.spans if span.name == "Created HB rooms"]
+    return span.counters["cached"]
+
+
+def test_stage_keys_include_tolerance(monkeypatch):
+    room_geo = [open_box(300)]
+    assert not rooms_cached(room_geo)
+    assert rooms_cached(room_geo)
+    monkeypatch.setattr(heath_deps, "tolerance", heath_deps.tolerance / 10)
+    assert not rooms_cached(room_geo)
+
+
+def test_build_job_keeps_warnings_and_reports_all_progress():
+    room_geo = [open_box(400), open_box(410)]
+    events = []
+    with redirect_stdout(io.StringIO()):
+        job = heath.start_build(None, room_geo, [], [], [], [], [], WINDOWS, None, [], "m",
+            listeners=[lambda *event: events.append(event)])
+        assert job.wait(60) and job.error is None
+        assert heath.start_build(None, room_geo, [], [], [], [], [], WINDOWS, None, [], "m") is job
+    assert NOT_CLOSED in job.warnings[0]
+    log = io.StringIO()
+    with redirect_stdout(log):
+        model, _ = job.result
+    assert NOT_CLOSED in log.getvalue() # shown again by the thread reading the result
+    assert len(model.rooms) == 2
+    assert {stage for stage, _, _ in events} >= {"rooms", "apertures", "window shades"}
+    assert all(job.progress[stage] == (total, total) for stage, (_, total) in job.progress.items())
+
+
+def test_stage_cache_is_checked_before_model_cache(tmp_path):
+    room_geo = [open_box(500)]
+    for checked in (True, False):
+        trace = heath.Trace()
+        with redirect_stdout(io.StringIO()):
+            heath.create_hb_model(None, room_geo, [], [], [], [], [], WINDOWS, None, [], "m", trace=trace, model_cache_folder=str(tmp_path))
+        assert any(span.name == "Checked model cache" for span in trace.spans) == checked
+    heath.flush_model_cache()
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_typical_rooms_group_floors():
+    # 4 floors of 4 rooms: the two middle floors are typical, the two middle rooms of a floor are copies too
+    with redirect_stdout(io.StringIO()):
+        model, _ = heath.create_hb_model(None, bench_heath.make_rooms(4, 4), [], [], [], [], [], WINDOWS, None, [], "m",
+            use_cache=False, room_keys=[str(i) for i in range(16)], typical_rooms=True)
+    assert len(model.rooms) == 12
+    by_key = {room.user_data["heath_key"]: room for room in model.rooms}
+    assert sorted(room.multiplier for room in model.rooms) == [1] * 8 + [2] * 4
+    assert all(by_key[str(4 + i)].user_data["heath_group_keys"] == [str(4 + i), str(8 + i)] for i in range(4))
+    room_map = heath.typical_room_map(model)
+    assert len(room_map) == 8 and set(room_map.values()) == {by_key[str(4 + i)].identifier for i in range(4)}
+
+    rooms = {room.identifier: room for room in model.rooms}
+    faces = {face.identifier: face for room in model.rooms for face in room.faces}
+    pairs = 0
+    for room in model.rooms:
+        for face in room.faces:
+            bc = face.boundary_condition
+            if isinstance(bc, heath.SurfaceBC):
+                other = rooms[bc.boundary_condition_objects[-1]]
+                assert other.multiplier == room.multiplier
+                assert faces[bc.boundary_condition_object].boundary_condition.boundary_condition_object == face.identifier
+                pairs += 1
+    # walls between rooms on a floor stay Surface, floors and ceilings of the typical floors become Adiabatic
+    assert pairs == 2 * 3 * 3 # 3 walls on each of the 3 kept floors
+    assert sum(face.boundary_condition.name == "Adiabatic" for face in by_key["4"].faces) == 2
@@ -0,0 +1,27 @@
+"""sweep against run_batch builds of the same variant"""
+
+import json
+
+import bench_heath
+import heath
+import heath_batch
+
+heath.load_dependencies()
+
+WINDOWS = heath.WindowSettings(0.4, 2.0, 0.8, 3.0, 0.2)
+
+
+def hvac_ids(path):
+    with open(path) as f:
+        return [hvac["identifier"] for hvac in json.load(f)["properties"]["energy"]["hvacs"]]
+
+
+def test_sweep_keeps_shared_hvac(tmp_path):
+    base = heath_batch.Variant("s", bench_heath.make_rooms(2, 3), energy_systems=["VRF"], shared_hvac=True)
+    result, = heath_batch.sweep(base, [WINDOWS], [None], str(tmp_path), workers=1)
+    assert result.error is None
+    assert len(hvac_ids(result.path)) == 1
+
+    full, = heath_batch.run_batch([heath_batch.Variant("f", base.room_geo, window_settings=WINDOWS,
+        energy_systems=["VRF"], shared_hvac=True)], str(tmp_path), workers=1)
+    assert len(hvac_ids(full.path)) == 1
@@ -0,0 +1,76 @@
+"""LRUCache, DiskCache and content_hash"""
+
+import gzip
+import os
+import threading
+
+from ladybug_geometry.geometry3d.pointvector import Point3D
+
+from heath import WindowSettings
+from heath_cache import DiskCache, LRUCache, content_hash
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_lru_get_or_build_caches_none():
+    cache = LRUCache(2)
+    assert cache.get_or_build("a", lambda: None) == (None, False)
+    assert cache.get_or_build("a", lambda: 1) == (None, True)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_get_or_build_from_threads():
+    cache = LRUCache(4)
+    hits = []
+    def run():
+        for i in range(2000):
+            value, hit = cache.get_or_build(i % 8, lambda: i % 8)
+            assert value == i % 8
+            hits.append(hit)
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache) == 4
+    assert cache.hits + cache.misses == len(hits)
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path), "1", 2**20)
+    cache.put("k", {"a": [1, 2]})
+    assert cache.get("k") == {"a": [1, 2]}
+    assert cache.get("missing") is None
+    assert DiskCache(str(tmp_path), "2", 2**20).get("k") is None
+    assert not os.path.exists(cache.path("k"))
+
+
+def test_disk_cache_removes_corrupt_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), "1", 2**20)
+    for i, content in enumerate([b"[1, 2]\n{}", b"not json", b'{"version": "1", "sha256": "0"}\n{}']):
+        with gzip.open(cache.path(str(i)), "wb") as f:
+            f.write(content)
+        assert cache.get(str(i)) is None
+        assert not os.path.exists(cache.path(str(i)))
+    with open(cache.path("3"), "wb") as f: # gzip header, broken deflate stream
+        f.write(gzip.compress(b"")[:10] + b"\xff" * 20)
+    assert cache.get("3") is None
+    assert not os.path.exists(cache.path("3"))
+
+
+def test_content_hash():
+    assert content_hash({"a": 1, "b": [1.0, None]}) == content_hash({"b": [1.0, None], "a": 1})
+    assert content_hash(1) != content_hash(1.0) != content_hash("1")
+    assert content_hash([1, 2]) != content_hash([[1], 2])
+    assert content_hash(Point3D(1, 2, 3)) == content_hash(Point3D(1, 2, 3)) != content_hash(Point3D(1, 2, 4))
+    ws = WindowSettings(0.4, 2.0, 0.8, 3.0, 0.2)
+    assert content_hash(ws) == content_hash(WindowSettings(0.4, 2.0, 0.8, 3.0, 0.2))
+    assert content_hash(ws) != content_hash(WindowSettings(0.4, 2.0, 0.8, 3.0, 0.3))
@@ -0,0 +1,201 @@
+"""heath_geometry against the honeybee and per-face implementations it replaces"""
+
+from contextlib import redirect_stdout
+import io
+import math
+import random
+
+import numpy as np
+import pytest
+from honeybee.room import Room
+from ladybug_geometry.geometry3d.face import Face3D
+from ladybug_geometry.geometry3d.plane import Plane
+from ladybug_geometry.geometry3d.pointvector import Point3D, Vector3D
+from ladybug_geometry.geometry3d.polyface import Polyface3D
+
+import bench_heath
+import heath
+from heath_geometry import (
+    BoxGrid, FaceArrays, GuideIndex, boxes_overlap, box_distance, elevation_angle, face3ds_to_mesh3d, face_box,
+    face_from_frame, face_to_frame, faces_away_from_box, merge_coplanar_faces, mesh_arrays_to_face3ds,
+    overlap_components, overlapping_pairs, solve_adjacency, wall_frame
+)
+
+heath.load_dependencies()
+TOLERANCE = 0.01
+
+
+def random_boxes(count, seed):
+    rng = random.Random(seed)
+    boxes = []
+    for _ in range(count):
+        lo = [rng.uniform(0, 50) for _ in range(3)]
+        boxes.append((tuple(lo), tuple(v + rng.uniform(0, 8) for v in lo)))
+    return boxes
+
+
+def make_rooms(floors, rooms_per_floor, extra=()):
+    with redirect_stdout(io.StringIO()):
+        return heath._create_rooms(bench_heath.make_rooms(floors, rooms_per_floor) + list(extra), [])
+
+
+def per_face_loop(vertices, faces, tolerance):
+    """The per-face conversion of to_face3d_patched for Rhino meshes, triangles repeat their third index"""
+    pts = [Point3D(*v) for v in vertices.tolist()]
+    out = []
+    for face in faces.tolist():
+        if face[2] != face[3]:
+            lb_face = Face3D([pts[i] for i in face])
+            if lb_face.area != 0:
+                if any(lb_face.plane.distance_to_point(v) >= tolerance for v in lb_face.vertices):
+                    out.append(Face3D((pts[face[0]], pts[face[1]], pts[face[2]])))
+                    out.append(Face3D((pts[face[3]], pts[face[0]], pts[face[1]])))
+                else:
+                    out.append(lb_face)
+        else:
+            lb_face = Face3D([pts[i] for i in face[:3]])
+            if lb_face.area != 0:
+                out.append(lb_face)
+    return out
+
+
+def random_mesh(seed):
+    rng = np.random.default_rng(seed)
+    vertices = rng.uniform(-50, 50, (600, 3))
+    vertices[:200, 2] = 0.0 # planar quads
+    vertices = np.concatenate([vertices, vertices[:40]]) # duplicate vertices
+    faces = rng.integers(0, 200, (1200, 4))
+    faces[600:] = rng.integers(0, len(vertices), (600, 4))
+    triangles = rng.random(len(faces)) < 0.4
+    faces[triangles, 3] = faces[triangles, 2]
+    faces[:20, 1] = faces[:20, 0] # degenerate
+    return vertices.astype(np.float32).astype(np.float64), faces
+
+
+def face_key(face):
+    return tuple((p.x, p.y, p.z) for p in face.vertices), tuple(face.normal)
+
+
+def test_box_grid_matches_brute_force():
+    boxes = random_boxes(300, 2)
+    grid = BoxGrid(boxes)
+    for query in random_boxes(50, 3):
+        assert grid.query(query) == [i for i, box in enumerate(boxes) if boxes_overlap(box, query)]
+
+
+def test_overlap_components_match_brute_force():
+    boxes = random_boxes(200, 4)
+    pairs = {(i, j) for i in range(len(boxes)) for j in range(i + 1, len(boxes)) if boxes_overlap(boxes[i], boxes[j], 0.1)}
+    assert {tuple(sorted(pair)) for pair in overlapping_pairs(boxes, 0.1)} == pairs
+    component = {}
+    for k, members in enumerate(overlap_components(boxes, 0.1)):
+        for i in members:
+            component[i] = k
+    assert sorted(component) == list(range(len(boxes)))
+    assert all(component[i] == component[j] for i, j in pairs)
+
+
+def test_solve_adjacency_matches_honeybee():
+    # a wider room on top, so faces of the rooms below are split
+    rooms = make_rooms(3, 4, [Polyface3D.from_box(8, 6, 3, Plane(o=Point3D(2, 0, 9)))])
+    Room.intersect_adjacency(rooms, TOLERANCE, heath.angle_tolerance)
+    ref = [room.duplicate() for room in rooms]
+    ref_info = Room.solve_adjacency(ref, TOLERANCE)
+    info = solve_adjacency(rooms, TOLERANCE)
+
+    def bcs(rooms):
+        return [(face.identifier, str(face.boundary_condition), getattr(face.boundary_condition, "boundary_condition_objects", ()))
+            for room in rooms for face in room.faces]
+    assert bcs(rooms) == bcs(ref)
+    def pairs(info):
+        return sorted(tuple(face.identifier for face in pair) for pair in info["adjacent_faces"])
+    assert pairs(info) == pairs(ref_info)
+    assert any(len(room.faces) > 6 for room in rooms) and len(pairs(info)) == 20
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_mesh_arrays_match_per_face_loop(seed):
+    vertices, faces = random_mesh(seed)
+    ref = per_face_loop(vertices, faces, TOLERANCE)
+    assert [face_key(face) for face in mesh_arrays_to_face3ds(vertices, faces, TOLERANCE)] == [face_key(face) for face in ref]
+
+
+def square(x, y, z=0.0):
+    return Face3D([Point3D(x, y, z), Point3D(x + 1, y, z), Point3D(x + 1, y + 1, z), Point3D(x, y + 1, z)])
+
+
+def test_merge_coplanar_faces():
+    faces = [square(x, y) for x in range(3) for y in range(2)] + [square(0, 0, 5.0), square(10, 0)]
+    merged = merge_coplanar_faces(faces, TOLERANCE, math.radians(1))
+    assert sorted(round(face.area, 6) for face in merged) == [1.0, 1.0, 6.0]
+    assert merge_coplanar_faces(faces[:1], TOLERANCE, math.radians(1)) == faces[:1]
+
+
+def test_box_distance_and_elevation_angle():
+    view_box = ((0, 0, 0), (10, 10, 3))
+    assert box_distance(((20, 0, 0), (30, 10, 10)), view_box) == 10
+    assert box_distance(((5, 5, 1), (6, 6, 2)), view_box) == 0
+    assert math.degrees(elevation_angle(((20, 0, 0), (30, 10, 10)), view_box)) == pytest.approx(45)
+    assert elevation_angle(((20, 0, -5), (30, 10, -1)), view_box) < 0
+
+
+def test_faces_away_from_box():
+    box = ((0, 0, 0), (1, 1, 1))
+    face = Face3D([Point3D(3, 0, 0), Point3D(3, 0, 1), Point3D(3, 1, 1), Point3D(3, 1, 0)])
+    away, toward = (face, face.flip()) if face.normal.x > 0 else (face.flip(), face)
+    assert faces_away_from_box(away, box) and not faces_away_from_box(toward, box)
+    assert not faces_away_from_box(away, ((0, 0, 0), (4, 1, 1))) # box on both sides
+
+
+def test_frame_round_trip():
+    face = Face3D([Point3D(0, 0, 0), Point3D(4, 0, 0), Point3D(4, 0, 3), Point3D(0, 0, 3)])
+    moved = face.rotate_xy(math.radians(37), Point3D(1, 2, 0)).move(Vector3D(10, -5, 3))
+    local = face_to_frame(face, wall_frame(face, TOLERANCE))
+    again = face_from_frame(local, wall_frame(moved, TOLERANCE))
+    assert all(p.distance_to_point(q) < 1e-9 for p, q in zip(again.vertices, moved.vertices))
+    assert wall_frame(Face3D([Point3D(0, 0, 0), Point3D(1, 0, 0), Point3D(1, 1, 0)]), TOLERANCE) is None
+
+
+def test_guide_index_matches_honeybee():
+    rooms = make_rooms(4, 6)
+    rng = random.Random(1)
+    guides = bench_heath.make_guides(4, 6)
+    for _ in range(60): # slab and wall pieces, some coplanar with room faces
+        x, z, y = rng.uniform(0, 24), rng.choice([0, 3, 6, 12]), rng.choice([0, 6, 3])
+        guides.append(Face3D([Point3D(x, 0, z), Point3D(x + 2, 0, z), Point3D(x + 2, 6, z), Point3D(x, 6, z)]))
+        guides.append(Face3D([Point3D(x, y, 0), Point3D(x + 3, y, 0), Point3D(x + 3, y, 12), Point3D(x, y, 12)]))
+    index = GuideIndex(guides, heath.tolerance, math.radians(heath.angle_tolerance))
+    for room in rooms:
+        ref = room.faces_by_guide_surface(guides, tolerance=heath.tolerance, angle_tolerance=heath.angle_tolerance)
+        assert [face.identifier for face in index.faces_by_guide_surface(room)] == [face.identifier for face in ref]
+    assert GuideIndex([], heath.tolerance, 0.01).faces_by_guide_surface(rooms[0]) == []
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_face_arrays_match_per_face_loop(seed):
+    vertices, faces = random_mesh(seed)
+    ref = per_face_loop(vertices, faces, TOLERANCE)
+    arrays = FaceArrays.from_mesh_arrays(vertices, faces, TOLERANCE)
+    assert [face_key(face) for face in arrays] == [face_key(face) for face in ref]
+    assert [face_key(face) for face in mesh_arrays_to_face3ds(vertices, faces, TOLERANCE)] == [face_key(face) for face in ref]
+    assert face_key(arrays[len(arrays) // 2]) == face_key(ref[len(ref) // 2])
+
+    box = ((-3, -3, -3), (3, 3, 3))
+    away = arrays.away_from_box(box)
+    assert away.tolist() == [faces_away_from_box(face, box) for face in ref]
+    assert [face_key(face) for face in arrays.select(~away)] == [face_key(f) for f, a in zip(ref, away) if not a]
+
+    mesh, ref_mesh = arrays.to_mesh3d(), face3ds_to_mesh3d(ref)
+    assert mesh.vertices == ref_mesh.vertices
+    assert [tuple(face) for face in mesh.faces] == [tuple(face) for face in ref_mesh.faces]
+
+
+def test_face_arrays_of_context_mesh():
+    mesh, = bench_heath.make_context(400, 40)
+    vertices = np.array([p.to_array() for p in mesh.vertices])
+    faces = np.array([tuple(f) if len(f) == 4 else (*f, f[2]) for f in mesh.faces])
+    arrays = FaceArrays.from_mesh_arrays(vertices, faces, TOLERANCE)
+    assert [face_key(face) for face in arrays] == [face_key(face) for face in per_face_loop(vertices, faces, TOLERANCE)]
+    assert arrays.nbytes < sum(len(face.vertices) * 3 * 8 for face in arrays)
+    assert [face_box(face) for face in arrays][:3] == [face_box(face) for face in per_face_loop(vertices, faces[:3], TOLERANCE)]
+
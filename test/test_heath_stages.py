@@ -0,0 +1,132 @@
+"""heath stages against the per-wall, per-aperture and per-face code they replace"""
+
+from contextlib import redirect_stdout
+import gzip
+import io
+import json
+import math
+
+import pytest
+from honeybee.model import Model
+from ladybug_geometry.geometry3d.face import Face3D
+from ladybug_geometry.geometry3d.pointvector import Point3D, Vector3D
+from ladybug_geometry.geometry3d.polyface import Polyface3D
+
+import bench_heath
+import heath
+
+heath.load_dependencies()
+
+WINDOWS = heath.WindowSettings(0.4, 2.0, 0.8, 3.0, 0.2)
+
+
+def area(shades):
+    return sum(shd.geometry.area for shd in shades)
+
+
+@pytest.mark.parametrize("mode", ["mesh", "merged"])
+def test_context_modes_keep_the_context_area(mode):
+    context = bench_heath.make_context(100, 12)
+    ref, _ = heath._add_shades(context)
+    shades, _ = heath._add_shades(context, heath.ContextSettings(mode=mode))
+    assert len(shades) < len(ref)
+    assert area(shades) == pytest.approx(area(ref))
+    with pytest.raises(ValueError):
+        heath._add_shades(context, heath.ContextSettings(mode="other"))
+
+
+def wall(x, y, height):
+    return Face3D([Point3D(x, y, 0), Point3D(x + 4, y, 0), Point3D(x + 4, y, height), Point3D(x, y, height)])
+
+
+def test_cull_context():
+    view_box = ((0, 0, 0), (10, 1, 3))
+    context = [wall(0, -20, 10), wall(0, -200, 10), wall(0, -40, 1)]
+    kept, culled = heath._cull_context(context, view_box, heath.ContextSettings(cull_distance=100, min_altitude=5))
+    assert kept == context[:1]
+    assert culled == ["Culled context geometry 1: further than 100 from all windows",
+        "Culled context geometry 2: below 5 degrees seen from the windows"]
+    assert heath._cull_context(context, view_box, None) == (context, [])
+    assert heath._cull_context(context, None, heath.ContextSettings(cull_distance=1)) == (context, [])
+
+
+def test_context_meshing_by_distance():
+    with redirect_stdout(io.StringIO()):
+        rooms = heath._create_rooms(bench_heath.make_rooms(1, 2), [])
+    context = [wall(0, -10, 3), wall(0, -100, 3), wall(0, -1000, 3)]
+    settings = heath.ContextSettings(lod_tiers=heath.DEFAULT_LOD_TIERS)
+    assert heath._context_meshing(context, rooms, settings) == ["FastRenderMesh", "Coarse", "Minimal"]
+    settings = heath.ContextSettings(lod_tiers=[(50.0, "Coarse"), (20.0, "FastRenderMesh")])
+    assert heath._context_meshing(context, rooms, settings) == ["FastRenderMesh", "Coarse", "Coarse"]
+    assert heath._context_meshing(context, rooms, heath.ContextSettings()) is None
+
+
+def building():
+    """Rows of box rooms, rotated copies of them and gable rooms"""
+    polyfaces = bench_heath.make_rooms(2, 4)
+    for angle in (30, 90, 137):
+        polyfaces += [p.rotate_xy(math.radians(angle), Point3D(0, 0, 0)).move(Vector3D(100, 100, 0)) for p in bench_heath.make_rooms(2, 3)]
+    gable = Face3D([Point3D(0, 0, 0), Point3D(0, 0, 3), Point3D(3, 0, 5), Point3D(6, 0, 3), Point3D(6, 0, 0)])
+    polyfaces += [Polyface3D.from_offset_face(gable.move(Vector3D(0, 50 + 10 * i, 0)), 8) for i in range(3)]
+    with redirect_stdout(io.StringIO()):
+        rooms = heath._create_rooms(polyfaces, [])
+        return heath._solve_adjacency(rooms, mutate=True)
+
+
+def max_distance(faces, ref_faces):
+    assert len(faces) == len(ref_faces)
+    assert all(len(f.vertices) == len(r.vertices) for f, r in zip(faces, ref_faces))
+    return max(p.distance_to_point(q) for f, r in zip(faces, ref_faces) for p, q in zip(f.vertices, r.vertices))
+
+
+@pytest.mark.parametrize("louvers", [None, heath.LouverSettings(0.3, 3, 0.0, 0.0, False), heath.LouverSettings(0.2, 10, 0.3, 20, True)])
+def test_window_shades_match_per_aperture(louvers):
+    rooms = building()
+    heath._auto_hb_apertures(rooms, WINDOWS.window_wall_ratio, WINDOWS.window_height, WINDOWS.sill_height, WINDOWS.horizontal_separation)
+    ref = [room.duplicate() for room in rooms]
+    for apt in (apt for room in ref for apt in room.apertures):
+        heath._add_border_shades(apt, WINDOWS.wall_thickness)
+        if louvers:
+            heath._add_louver_shades(apt, louvers.depth, louvers.count, louvers.dist, louvers.angle, louvers.direction)
+    heath._add_window_shades(rooms, WINDOWS, louvers, mutate=True)
+    shades = [shd for room in rooms for apt in room.apertures for shd in apt.outdoor_shades]
+    ref_shades = [shd for room in ref for apt in room.apertures for shd in apt.outdoor_shades]
+    assert [shd.identifier for shd in shades] == [shd.identifier for shd in ref_shades]
+    assert max_distance([shd.geometry for shd in shades], [shd.geometry for shd in ref_shades]) < 1e-6
+
+
+@pytest.mark.parametrize("args", [(0.4, 2.0, 0.8, 3.0), (0.9, 2.5, 0.5, 1.0), (0.3, 1.0, 1.0, 10.0)])
+def test_aperture_layouts_match_honeybee(args):
+    rooms = building()
+    ref = [room.duplicate() for room in rooms]
+    for room in ref:
+        for face in room.faces:
+            if isinstance(face.boundary_condition, heath.Outdoors) and isinstance(face.type, heath.Wall):
+                face.apertures_by_ratio_rectangle(*args)
+    trace = heath.Trace()
+    with trace.activate():
+        heath._auto_hb_apertures(rooms, *args)
+    apertures = [apt for room in rooms for apt in room.apertures]
+    ref_apertures = [apt for room in ref for apt in room.apertures]
+    assert [apt.identifier for apt in apertures] == [apt.identifier for apt in ref_apertures]
+    assert max_distance([apt.geometry for apt in apertures], [apt.geometry for apt in ref_apertures]) < 1e-6
+    assert trace.spans[0].counters["layout_hits"] > 0
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"include_plane": False, "included_prop": []}])
+def test_write_hbjson_matches_to_dict(tmp_path, kwargs):
+    with redirect_stdout(io.StringIO()):
+        model, _ = heath.create_hb_model(None, bench_heath.make_rooms(2, 3), [], [], bench_heath.make_guides(2, 3), [], [],
+            WINDOWS, heath.LouverSettings(0.3, 2, 0.0, 0.0, False), bench_heath.make_context(100, 12), "m", use_cache=False,
+            context_settings=heath.ContextSettings(mode="mesh"))
+    model.user_data = {"a": 1}
+    ref = json.dumps(model.to_dict(kwargs.get("included_prop"), False, kwargs.get("include_plane", True)))
+    path = heath.utils.write_hbjson(model, str(tmp_path / "m.hbjson"), **kwargs)
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == ref
+    path = heath.utils.write_hbjson(model, str(tmp_path / "m.hbjson.gz"), **kwargs)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert f.read() == ref
+    if not kwargs:
+        assert Model.from_hbjson(str(tmp_path / "m.hbjson")).to_dict() == model.to_dict()
+
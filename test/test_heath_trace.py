@@ -0,0 +1,75 @@
+"""Trace spans, counters, reports and progress"""
+
+import json
+import threading
+
+import pytest
+
+import heath_trace
+from heath_trace import BuildCancelled, Trace
+
+
+def test_spans_nest_and_count():
+    trace = Trace()
+    with trace.activate():
+        with heath_trace.span("outer", rooms=2):
+            with heath_trace.span("inner"):
+                heath_trace.count(faces=12)
+            heath_trace.count(cached=True)
+        trace.note("a note")
+    outer, = trace.spans
+    assert outer.counters == {"rooms": 2, "cached": True}
+    assert [child.name for child in outer.children] == ["inner"]
+    assert outer.children[0].counters == {"faces": 12}
+    assert outer.duration >= outer.children[0].duration
+    lines = trace.report()
+    assert lines[0].startswith("outer in ") and lines[0].endswith("(cached)")
+    assert lines[1] == "a note"
+
+
+def test_span_without_active_trace_does_nothing():
+    with heath_trace.span("stage") as sp:
+        heath_trace.count(faces=1)
+        heath_trace.progress("stage", 1, 2)
+    assert sp is None
+
+
+def test_trace_is_per_thread():
+    trace = Trace()
+    def other():
+        with heath_trace.span("other thread"):
+            pass
+    with trace.activate():
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+    assert trace.spans == []
+
+
+def test_progress_is_forwarded_and_cancels():
+    calls = []
+    cancel = threading.Event()
+    trace = Trace(on_progress=lambda *args: calls.append(args), cancel_event=cancel, progress_interval=3600)
+    with trace.activate():
+        for i in range(5):
+            heath_trace.progress("stage", i, 4)
+        cancel.set()
+        with pytest.raises(BuildCancelled):
+            heath_trace.progress("stage", 1, 4)
+    assert calls == [("stage", 0, 4), ("stage", 4, 4)]
+
+
+def test_export(tmp_path):
+    trace = Trace(memory=True)
+    with trace.activate():
+        with heath_trace.span("outer"):
+            with heath_trace.span("inner"):
+                data = [0] * 10000
+    del data
+    json_path, chrome_path = trace.export(str(tmp_path))
+    with open(json_path) as f:
+        assert json.load(f)["spans"][0]["children"][0]["name"] == "inner"
+    with open(chrome_path) as f:
+        events = json.load(f)["traceEvents"]
+    assert [event["name"] for event in events] == ["outer", "inner"]
+    assert events[0]["args"]["peak_memory"] >= events[1]["args"]["peak_memory"] > 0
@@ -0,0 +1,91 @@
+"""update_hb_model against full create_hb_model builds of the same geometry"""
+
+from contextlib import redirect_stdout
+import io
+
+import pytest
+from ladybug_geometry.geometry3d.plane import Plane
+from ladybug_geometry.geometry3d.pointvector import Point3D
+from ladybug_geometry.geometry3d.polyface import Polyface3D
+
+import bench_heath
+import heath
+
+heath.load_dependencies()
+
+WINDOWS = heath.WindowSettings(0.4, 2.0, 0.8, 3.0, 0.2)
+LOUVERS = heath.LouverSettings(0.3, 2, 0.0, 0.0, False)
+
+
+def box(x, y, z, width=4.0, depth=6.0, height=3.0):
+    return Polyface3D.from_box(width, depth, height, Plane(o=Point3D(x, y, z)))
+
+
+def build(geometry):
+    keys = list(geometry)
+    with redirect_stdout(io.StringIO()):
+        model, _ = heath.create_hb_model(None, list(geometry.values()), [], [], bench_heath.make_guides(2, 3), [], [],
+            WINDOWS, LOUVERS, [], "m", use_cache=False, room_keys=keys)
+    return model
+
+
+def update(model, changed, removed=()):
+    with redirect_stdout(io.StringIO()):
+        model, _ = heath.update_hb_model(None, model, changed, list(removed), [], [], bench_heath.make_guides(2, 3), [], [],
+            WINDOWS, LOUVERS)
+    return model
+
+
+def summary(model):
+    """Geometry, boundary condition types, apertures and shades per room key, without identifiers"""
+    def coords(geo):
+        return tuple(sorted((round(p.x, 6), round(p.y, 6), round(p.z, 6)) for p in geo.boundary))
+    rooms = {}
+    for room in model.rooms:
+        faces = sorted((type(face.type).__name__, type(face.boundary_condition).__name__, coords(face.geometry),
+            tuple(sorted((coords(apt.geometry), len(apt.outdoor_shades)) for apt in face.apertures)))
+            for face in room.faces)
+        rooms[room.user_data["heath_key"]] = faces
+    return rooms
+
+
+@pytest.fixture
+def tower():
+    return {f"k{i}": geo for i, geo in enumerate(bench_heath.make_rooms(2, 3))}
+
+
+def test_repeated_updates_match_full_build(tower):
+    model = build(tower)
+    steps = [
+        {"k2": box(8, 3, 0)}, # half touching its neighbour
+        {"k2": box(40, 0, 0)}, # far away
+        {"k2": box(8, 0, 0), "k6": box(12, 0, 3)}, # back, and a new room
+        {"k4": box(4, 0, 3, width=2.0)},
+    ]
+    geometry = dict(tower)
+    for changed in steps:
+        geometry.update(changed)
+        model = update(model, changed)
+        assert summary(model) == summary(build(geometry))
+
+
+def test_removed_room_matches_full_build(tower):
+    model = update(build(tower), {}, ["k1"])
+    del tower["k1"]
+    assert summary(model) == summary(build(tower))
+
+
+def test_input_model_is_not_modified(tower):
+    model = build(tower)
+    before = model.to_dict()
+    update(model, {"k2": box(8, 3, 0)})
+    assert model.to_dict() == before
+
+
+def test_sources_are_only_kept_with_room_keys(tower):
+    assert all("heath_source" in room.user_data for room in build(tower).rooms)
+    with redirect_stdout(io.StringIO()):
+        model, _ = heath.create_hb_model(None, list(tower.values()), [], [], [], [], [], WINDOWS, None, [], "m", use_cache=False)
+    assert not any("heath_source" in room.user_data for room in model.rooms)
+    with pytest.raises(ValueError):
+        update(model, {"0": box(8, 3, 0)})